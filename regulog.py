@@ -27,7 +27,6 @@ ReguLog can be used via a GUI (start script with no argument) or on the command
     other searches.
 
 Known issues:
- - A tar file packed in a zip file cannot be read ("seek" error)
  - QT: during search, too many displayed events can lead to HMI freeze or crash. As a
    workaround set the verbosity to "Quiet" or run the tool in command-line mode.
  - QT/bfScriptInterface: "Kill" button does not work
@@ -85,7 +84,6 @@ Known issues:
 # TODO support cascaded event types (Parent, Include), with includes of patterns in other files
 # TODO keep comments in saved file, improve formatting - see http://effbot.org/zone/element-pi.htm
 # TODO add option to fix timestamp inconsistencies
-# TODO add options to set min max timestamps to search
 
 # TODO join syslog-style log rotation
 # TODO limit size of joined log files
@@ -98,7 +96,6 @@ Known issues:
 # TODO add option remove duplicated events
 # TODO improve error message after execution error (now execution stack displayed)
 # TODO fix kill button
-# TODO multithreaded search
 # TODO Re-edit event type parameters
 # TODO improve globalsource management for extract (single dest dir), LOG dirs reduction
 # TODO Improve global source, i.e. each found archive in dir treated as soon as found
@@ -107,6 +104,8 @@ Known issues:
 
 # Imports
 import os, sys, traceback, tarfile, zipfile, re, datetime, time, shutil, collections
+import sre_parse, sre_constants, itertools, multiprocessing, heapq, operator, tempfile, cPickle
+import sqlite3, hashlib, bisect, zlib, copy, weakref
 import psutil
 import bfcommons, bfcommons.bfElemTree as ET
 
@@ -147,7 +146,7 @@ else:
 
 
 
-class Event():
+class Event(object):
   """Data of found occurrences in logs. To be completely defined, the object methods need to be
      called in the following order:
        - __init__ to initialize standard fields
@@ -155,42 +154,91 @@ class Event():
        - parseText to extract fields from the text match
        - parseTimestamp to extract time/date fields from text (calls setTimestamp)
        - execute to run execOnMatch code
-       - parseDisplay to generate the display_on_match field as defined in event type"""
+       - parseDisplay to generate the display_on_match field as defined in event type
+     System fields are not stored as strings but computed when requested (see get_field), so
+     that many events can be held in memory. The events may be spilled to disk by the event set
+     holding them, see toSpillRecord."""
+
+  __slots__ = ['eventType', 'path', 'raw', 'linenum', 'seqnum', 'timestamp', 'timestampSpan',
+               'ufields', 'fieldNames', 'displayOnMatch', 'changedFields', 'matchedText',
+               'timestampLine', 'eventSet', '__weakref__']
+
+  # Slots written to disk with the other data of a spilled event, when they have a value
+  spilledSlots = ['raw', 'linenum', 'timestampSpan', 'displayOnMatch', 'changedFields']
+
+  # Value of system fields not defined yet
+  undefined = object()
+
+  # System fields in order of definition, with the functions computing their values
+  systemFields = [
+    ('_name', lambda ev: ev.eventType.name),
+    ('_description', lambda ev: ev.eventType.description if ev.eventType.description else ""),
+    ('_source_path', lambda ev: ev.path),
+    ('_source_filename', lambda ev: os.path.basename(ev.path)),
+    ('_display_on_match', lambda ev: ev.displayOnMatch),
+    ('_sequence_number', lambda ev: str(ev.seqnum)),
+    ('_timestamp', lambda ev: ev.timestamp.isoformat()),
+    ('_date', lambda ev: str(ev.timestamp.date())),
+    ('_time', lambda ev: str(ev.timestamp.time())),
+    ('_raw', lambda ev: ev.raw),
+    ('_line_number', lambda ev: ev.linenum if ev.linenum is Event.undefined else str(ev.linenum)),
+    ('_changed_fields', lambda ev: ev.changedFields)]
+  systemFieldFunctions = dict(systemFields)
+
+  # Key of the chronological order of events, for stable sorts of lists already in sequence
+  #  number order (same order as __cmp__ without comparing sequence numbers)
+  sortKey = operator.attrgetter('timestamp')
 
   def __init__(self, eventType, path):
     """Initializes an event with the standard fields"""
 
     self.eventType = eventType
+    self.path = path
+    self.eventSet = None           # EventSet holding the event, set by EventSet.add_event
 
-    # Defines user and system fields dictionaries
-    self.sfields = dict()
+    # Defines user fields dictionary, and the order of their names if not the order of the
+    #  dictionary (see fromSpillRecord)
     self.ufields = dict()
-
-    # Stores standard values (check as well get_field for additional items)
-    self.sfields['_name'] = eventType.name
-    self.sfields['_description'] = eventType.description if eventType.description else ""
-    self.sfields['_source_path'] = path
-    self.sfields['_source_filename'] = os.path.basename(path)
+    self.fieldNames = None
 
     # Default values if left undefined or failure
-    self.sfields['_display_on_match'] = None
+    self.raw = Event.undefined
+    self.linenum = Event.undefined
+    self.changedFields = Event.undefined
+    self.displayOnMatch = None
+    self.matchedText = None        # Texts used to create the event, see setMatchedTexts
+    self.timestampLine = None
     self.ufields['_changed_fields'] = None
-    self.setSeqnum(-1)
-    self.setTimestamp()
+    self.seqnum = -1
+    self.timestamp = datetime.datetime.min
     self.timestampSpan = (0,0)     # Default text span if no timestamp has been found
 
 
   def __str__(self):
     return "Event: id:" + str(id(self)) + " ts:" + str(self.timestamp) +\
            " seqnum:" + str(self.seqnum) +\
-           " ufields:" + str(self.ufields) + " sfields:" + str(self.sfields)
+           " ufields:" + str(self.ufields) + " sfields:" + str(self.get_system_fields())
+
+  def hasSystemField(self, name):
+    """Returns true if the given name is a defined system field"""
+    f = Event.systemFieldFunctions.get(name)
+    return f is not None and f(self) is not Event.undefined
 
   # Function advertised for Python code
   def set_field(self, name, value):
-    if name in self.sfields:
+    if self.hasSystemField(name):
       raise RuntimeError("Overwriting " + name + " system field not allowed")
     else:
-      self.ufields[name] = value
+      self.setUserField(name, value)
+
+  def setUserField(self, name, value):
+    """Sets a user field, keeps the indexes of the event set holding the event up to date"""
+    if self.eventSet is not None:
+      self.eventSet.unindexEvent(self, name)
+    self.ufields[name] = value
+    if self.eventSet is not None:
+      self.eventSet.indexEvent(self, name)
+      self.eventSet.storeField(self, name)
 
   # Function advertised for Python code
   def set_fields(self, dictionary):
@@ -202,10 +250,10 @@ class Event():
 
   # Function advertised for Python code
   def add_field(self, name, value):
-    if name in self.sfields or name in self.ufields:
+    if self.hasSystemField(name) or name in self.ufields:
       raise RuntimeError("Field " + name + " already exists")
     else:
-      self.ufields[name] = value
+      self.setUserField(name, value)
 
   # Function advertised for Python code
   def add_fields(self, dictionary):
@@ -220,21 +268,25 @@ class Event():
   def has_field(self, name):
     """Returns true if the given field name or virtual field name is part of the event"""
     return (name in ['_user_fields', '_system_fields', '_flat', '_core', '_flat_core']) or \
-           (name in self.ufields) or (name in self.sfields)
+           (name in self.ufields) or self.hasSystemField(name)
 
   # Function advertised for Python code
   def get_field(self, name):
     if name in self.ufields: return self.ufields[name]
-    elif name in self.sfields: return self.sfields[name]
+
+    # System fields are computed from the event data
+    f = Event.systemFieldFunctions.get(name)
+    value = f(self) if f is not None else Event.undefined
+    if value is not Event.undefined: return value
     elif name == "_user_fields": return str(self.ufields)
-    elif name == "_system_fields": return str(self.sfields)
+    elif name == "_system_fields": return str(self.get_system_fields())
     elif name == "_flat":
-      return self.sfields['_raw'].replace('\n', '')
+      return self.raw.replace('\n', '')
     elif name == "_core":
-      raw = self.sfields['_raw']
+      raw = self.raw
       return raw[0:self.timestampSpan[0]] + raw[self.timestampSpan[1]:]
     elif name == "_flat_core":
-      raw = self.sfields['_raw']
+      raw = self.raw
       core = raw[0:self.timestampSpan[0]] + raw[self.timestampSpan[1]:]
       return core.replace('\n', '')
 
@@ -245,9 +297,23 @@ class Event():
   def get_user_fields(self):
     return self.ufields
 
+  def getUserFieldNames(self):
+    """Returns the names of the user fields in the order of their dictionary, the order of the
+       dictionary of an event read back from disk being the one before it was written (see
+       fromSpillRecord), then the fields added since"""
+    if self.fieldNames is None:
+      return self.ufields.keys()
+    return [k for k in self.fieldNames if k in self.ufields] + \
+           [k for k in self.ufields if k not in self.fieldNames]
+
   # Function advertised for Python code
   def get_system_fields(self):
-    return self.sfields
+    res = dict()
+    for (name, f) in Event.systemFields:
+      value = f(self)
+      if value is not Event.undefined:
+        res[name] = value
+    return res
 
   # Function advertised for Python code
   def seconds_since(self, ev):
@@ -255,21 +321,17 @@ class Event():
 
 
   def setRaw(self, raw):
-    self.sfields['_raw'] = raw
+    self.raw = raw
 
   def setLinenum(self, linenum):
-    self.sfields['_line_number'] = str(linenum)
+    self.linenum = int(linenum)
 
   def setSeqnum(self, num):
     self.seqnum = num
-    self.sfields['_sequence_number'] = str(num)
 
   def setTimestamp(self, timestamp=None):
-    """Sets the timesamp of this event and related fields, minimum time if timestamp not given"""
+    """Sets the timesamp of this event, minimum time if timestamp not given"""
     self.timestamp = timestamp if timestamp is not None else datetime.datetime.min
-    self.sfields['_timestamp'] = self.timestamp.isoformat()
-    self.sfields['_date'] = str(self.timestamp.date())
-    self.sfields['_time'] = str(self.timestamp.time())
 
 
   def replaceFields(self, text, events):
@@ -342,7 +404,7 @@ class Event():
 
     # Parses text if not already provided
     if textRexResult is None:
-      textRexResult = self.eventType.searchText(self.sfields['_raw'])
+      textRexResult = self.eventType.searchText(self.raw)
 
     # At this point, it must be assumed that string matched
     assert textRexResult is not None
@@ -355,56 +417,22 @@ class Event():
     """Matches compiled regexp, if yes updates system fields, may raise exceptions. Searches in
        alternativeText if given, otherwise in current _raw system field"""
 
-    ts = self.eventType.searchTimestamp(alternativeText if alternativeText else self.sfields['_raw'])
-    assert ts is not None, "Timestamp regex does not match in" + str(self.sfields['_raw'])
-
-    # Gets named groups
-    tsfields = ts.groupdict()
+    ts = self.eventType.searchTimestamp(alternativeText if alternativeText else self.raw)
+    assert ts is not None, "Timestamp regex does not match in" + str(self.raw)
 
-    # Searches for keys in tsfields with names compatible with timestamp fields
-    names = dict()
-    for k in tsfields.keys():
-      # Select a field name if name syntax is as _<letter><empty_or_digit>
-      if tsfields[k] is not None and len(tsfields[k])>0 and k[0] == '_' and len(k) in [2,3] and \
-         k[1] in ['Y', 'M', 'D', 'h', 'm', 's'] and \
-         (len(k) == 2 or (len(k)==3 and k[2] >= "0" and k[2] <= "9")):
-          names[k[1]] = k
-    assert len(names) >= 4, "Not enough timestamp fields"
+    self.setTimestampData(self.eventType.getTimestampData(ts, sourceTime))
 
-    # Year field may not be present in timestamp fields
-    if 'Y' in names:
-      year = int(tsfields[names['Y']])
-      if year < 100: year += 2000           # If the year is acquired as 2-digits (e.g. "31/12/16")
-    else:
-      year = sourceTime.year if sourceTime is not None else datetime.datetime.now().year
 
-    # Month field may be given as text
-    m = tsfields[names['M']]
-    if len(m) <= 2:
-      month = int(m)
-    else:
-      m = m[0:3].upper()
-      months = {"JAN":1,"FEB":2,"MAR":3,"APR":4,"MAY":5,"JUN":6,
-                "JUL":7,"AUG":8,"SEP":9,"OCT":10,"NOV":11,"DEC":12}
-      month = int(months[m])
-
-    # Second field may not be present
-    if 's' in names:
-      second = int(tsfields[names['s']])
-    else:
-      second = 0
+  def setTimestampData(self, timestampData):
+    """Sets the timestamp, timestamp span and additional fields given by
+       EventType.getTimestampData, may raise exceptions if additional fields already exist"""
 
-    # Convert common time values
-    day = int(tsfields[names['D']])
-    hour = int(tsfields[names['h']])
-    minute = int(tsfields[names['m']])
-
-    # Sets the timestamp fields and retrieves additional fields if everything went well
-    self.setTimestamp(datetime.datetime(year, month, day, hour, minute, second))
-    self.timestampSpan = ts.span()
-    for k in tsfields.keys():
-      if tsfields[k] is not None and k[0] != "_":
-        self.add_field(k, tsfields[k])
+    # Sets the timestamp fields and retrieves additional fields
+    (timestamp, span, fields) = timestampData
+    self.setTimestamp(timestamp)
+    self.timestampSpan = span
+    for (k, v) in fields:
+      self.add_field(k, v)
 
 
   def parseDisplay(self, previousEvent=None, events=None):
@@ -413,24 +441,24 @@ class Event():
     # Determines changed fields
     res = ''
     if previousEvent is not None:
-      for k in self.ufields:
+      for k in self.getUserFieldNames():
         if k not in previousEvent.ufields or previousEvent.ufields[k] != self.ufields[k]:
           res += (',' if len(res) > 0 else '') + k
-    self.sfields['_changed_fields'] = res if len(res) > 0 else None
+    self.changedFields = res if len(res) > 0 else None
 
     # Computes display string on match
     if self.eventType.displayOnMatch:
-      self.sfields['_display_on_match'] = self.replaceFields(self.eventType.displayOnMatch, events)
+      self.displayOnMatch = self.replaceFields(self.eventType.displayOnMatch, events)
 
 
   def display(self, hideTimestamp):
     """Prints the event as string if display on match is defined otherwise nothing displayed"""
 
-    if self.sfields['_display_on_match']:
-      if (self.eventType.displayIfChanged and self.sfields['_changed_fields'] is not None) or \
+    if self.displayOnMatch:
+      if (self.eventType.displayIfChanged and self.changedFields is not None) or \
       (not self.eventType.displayIfChanged):
-        t = self.sfields['_timestamp'] if not hideTimestamp else ""
-        print t + " " + self.sfields['_display_on_match']
+        t = self.timestamp.isoformat() if not hideTimestamp else ""
+        print t + " " + self.displayOnMatch
 
 
   def toXML(self, full=True):
@@ -445,7 +473,8 @@ class Event():
     sel2 = ["_flat", "_source_path", "_line_number"]
 
     # Export system fields in alphabetical order or first set of selected fields
-    for k in sorted(self.sfields.keys() + ["_flat", "_flat_core", "_core"]) if full else sel1:
+    sfields = self.get_system_fields().keys() + ["_flat", "_flat_core", "_core"]
+    for k in sorted(sfields) if full else sel1:
       e = ET.Element(k)
       if full:
         e.appendCDATA(self.get_field(k))
@@ -471,6 +500,77 @@ class Event():
 
     return elem
 
+  def toRecord(self):
+    """Returns a tuple with the texts used to create the event during search, i.e. the text
+       matched by the text regexp and the line where the timestamp was found (see
+       setMatchedTexts), used to transfer events between processes, see fromRecord"""
+    return (self.eventType.name, self.path, self.raw, self.linenum, self.matchedText,
+            self.timestampLine)
+
+  @staticmethod
+  def fromRecord(eventTypes, record, sourceTime):
+    """Returns a new event built from a record given by toRecord, using the dict of event types.
+       Text and timestamp are parsed again in the same sequence as during search, such that all
+       fields are exactly the same as for an event created by the search."""
+    (name, path, raw, linenum, matchedText, timestampLine) = record
+    ev = Event(eventTypes[name], path)
+    ev.parseText(ev.eventType.searchText(matchedText))
+    if timestampLine is not None:
+      ev.parseTimestamp(timestampLine, sourceTime=sourceTime)
+    ev.setRaw(raw)
+    ev.setLinenum(linenum)
+    return ev
+
+  def toSpillRecord(self):
+    """Returns a tuple with the whole data of a stored event, written to disk when the event is
+       spilled by its event set, see fromSpillRecord. User fields are given as a list of
+       (name, value) in the order of the dictionary."""
+    state = dict()
+    for name in Event.spilledSlots:
+      value = getattr(self, name)
+      if value is not Event.undefined:
+        state[name] = value
+    ufields = [(k, self.ufields[k]) for k in self.getUserFieldNames()]
+    return (self.eventType.name, self.path, self.seqnum, self.timestamp, ufields, state)
+
+  @staticmethod
+  def fromSpillRecord(eventTypes, record):
+    """Returns a new event built from a record given by toSpillRecord, not stored in any set.
+       A dictionary rebuilt from its items may not iterate in the same order (Python 2), the
+       order of the user fields is then kept with them, such that _changed_fields is the same
+       as before the event was written to disk."""
+    (name, path, seqnum, timestamp, ufields, state) = record
+    ev = Event(eventTypes[name], path)
+    ev.seqnum = seqnum
+    ev.timestamp = timestamp
+    ev.ufields = dict(ufields)
+    if ev.ufields.keys() != [k for (k, v) in ufields]:
+      ev.fieldNames = [k for (k, v) in ufields]
+    for (k, v) in state.items():
+      setattr(ev, k, v)
+    return ev
+
+  def toPendingRecord(self):
+    """Returns a tuple with the state of an event waiting for the end of its lines (unfinished
+       event), kept between incremental searches, see fromPendingRecord"""
+    return (self.eventType.name, self.path, self.ufields, self.timestamp, self.timestampSpan)
+
+  @staticmethod
+  def fromPendingRecord(eventTypes, record):
+    """Returns a new unfinished event built from a record given by toPendingRecord"""
+    (name, path, ufields, timestamp, timestampSpan) = record
+    ev = Event(eventTypes[name], path)
+    ev.ufields = ufields
+    ev.setTimestamp(timestamp)
+    ev.timestampSpan = timestampSpan
+    return ev
+
+  def setMatchedTexts(self, matchedText, timestampLine):
+    """Stores the texts used during search for later transfer with toRecord, timestampLine is
+       None if no timestamp was found"""
+    self.matchedText = matchedText
+    self.timestampLine = timestampLine
+
   def execute(self, executionContext):
     """Executes the python code ExecOnMatch"""
 
@@ -502,6 +602,8 @@ class ExecutionContext:
       return self.events.get_events(name, fields, before, limit)
     def delete_event(event):
       return self.events.delete_event(event)
+    def query_events(condition=None, params=(), limit=0):
+      return self.events.query_events(condition, params, limit)
 
     # Copy of local variables to be extended at each run (including local functions above)
     self.locals = locals().copy()
@@ -542,11 +644,29 @@ class ExecutionContext:
 
 class EventSet(dict):
   """"Structure holding events found during search. Events are arranged in lists per eventType,
-      where each list is referenced by the related event type name in a dictionary."""
-
-  def __init__(self, eventTypes):
+      where each list is referenced by the related event type name in a dictionary. Indexes of
+      the events per value of a field are built on first use by get_events, and then kept up
+      to date when events are added, deleted or their user fields are set. Deleted events are
+      only marked as such and stay in the lists until the next compaction. If spillSize is
+      greater than 0, at most spillSize events are kept in memory: the oldest events are moved
+      into a temporary archive database (see archiveEvents), and are merged with the events in
+      memory when sorted (see sortEvents). The events can also be written into a SQLite
+      database (see writeDatabase), which is then kept up to date and used by query_events. If
+      retention is greater than 0, the oldest events are removed beyond this number of events,
+      after being written into the export files and database given to startExport if any
+      (spillSize is then not used)."""
+
+  # System fields changing after the event is stored, not used to index events
+  unindexedFields = ['_display_on_match', '_changed_fields', '_sequence_number']
+
+  # Number of archived events read from the archive database per query
+  archiveChunkSize = 256
+
+  def __init__(self, eventTypes, spillSize=0, retention=0):
     """Inits the object using the list of event types, i.e. creates empty lists in dict"""
 
+    self.eventTypes = eventTypes
+
     # Sequence of all events used for event searches
     self.sequence = list()
 
@@ -557,6 +677,41 @@ class EventSet(dict):
     # Sequence number to be increased after each addition of event
     self.curSeqnum = 0
 
+    # Indexes per (event name or None for all events, field name), each index being a dict of
+    #  lists of events per field value in sequence order (None if a value cannot be indexed)
+    self.indexes = dict()
+
+    # True while the timestamps of the events in sequence are in chronological order
+    self.timeOrdered = True
+
+    # Number of deleted events still in sequence, removed by compact
+    self.numDeleted = 0
+
+    # Maximum number of events in memory (0 for no limit)
+    self.spillSize = spillSize if retention == 0 else 0
+
+    # Temporary database of the events archived beyond spillSize events, sequence number of the
+    #  oldest event in memory (all archived events are before), and archived events read back
+    #  or archived while still referenced, per sequence number
+    self.archive = None
+    self.archivedSeqnum = 0
+    self.archivedEvents = weakref.WeakValueDictionary()
+
+    # SQLite database connection once the events are written into a database file
+    self.database = None
+
+    # Maximum number of stored events (0 for no limit), and position in sequence of the oldest
+    #  event possibly not deleted
+    self.retention = retention
+    self.oldestPosition = 0
+
+    # Last event removed by the retention limit per event name, see previousEvent
+    self.evictedEvents = dict()
+
+    # Export files and database written as the events are removed, see startExport
+    self.exporter = None
+    self.exportDatabase = None
+
 
   def add_event(self, event):
     """Adds event after setting the sequence number in event"""
@@ -565,24 +720,395 @@ class EventSet(dict):
     event.setSeqnum(self.curSeqnum)
     self.curSeqnum += 1
 
+    # Checks if the events stay in chronological order
+    if len(self.sequence) > 0 and event.timestamp < self.sequence[-1].timestamp:
+      self.timeOrdered = False
+
     # Adds event to lists
     self[event.eventType.name].append(event)
     self.sequence.append(event)
+    event.eventSet = self
+    self.indexEvent(event)
+
+    # Spills the oldest events beyond the maximum number of events in memory
+    if self.spillSize > 0 and len(self.sequence) - self.numDeleted > self.spillSize:
+      self.archiveEvents()
+
+    # Removes the oldest events beyond the retention limit
+    if self.retention > 0:
+      while len(self.sequence) - self.numDeleted > self.retention:
+        ev = self.sequence[self.oldestPosition]
+        self.oldestPosition += 1
+        self.evictEvent(ev)
 
   def delete_event(self, event):
     """Removes given event from lists"""
 
-    # Removes event from both lists if found
-    if event in self.sequence:
-      # print ">>>delete from sequence", id(event), "at index", self.sequence.index(event)
-      del self.sequence[self.sequence.index(event)]
-    if event in self[event.eventType.name]:
-      del self[event.eventType.name][self[event.eventType.name].index(event)]
+    if self.hasEvent(event):
+      if self.database is not None:
+        self.database.execute("DELETE FROM events WHERE seqnum = ?", (event.seqnum,))
+        self.database.execute("DELETE FROM fields WHERE seqnum = ?", (event.seqnum,))
+      self.removeEvent(event)
+
+  def removeEvent(self, event):
+    """Removes the given stored event from indexes and marks it as deleted, lists are compacted
+       once deleted events are the majority"""
+
+    if self.isArchived(event):
+      self.archive.execute("DELETE FROM archive WHERE seqnum = ?", (event.seqnum,))
+      self.archive.execute("DELETE FROM fields WHERE seqnum = ?", (event.seqnum,))
+      event.eventSet = None
+      return
+
+    self.unindexEvent(event)
+    event.eventSet = None
+    self.numDeleted += 1
+    if self.numDeleted * 2 > len(self.sequence):
+      self.compact()
+
+  def evictEvent(self, event):
+    """Removes the given event beyond the retention limit, then writes it into the export files
+       and database given to startExport if any (it is not deleted from them)"""
+
+    if self.hasEvent(event):
+      self.removeEvent(event)
+      self.evictedEvents[event.eventType.name] = event
+      if self.exporter is not None:
+        self.exporter.write(event)
+      if self.exportDatabase is not None:
+        self.insertEvents(self.exportDatabase, [event])
+
+  def startExport(self, outputdir, filename):
+    """Writes the events removed by the retention limit into the export files in outputdir (see
+       save) and into the given SQLite database file (see writeDatabase) as they are removed,
+       such that all events are exported without being kept in memory. The stored events are
+       written at the end by save and writeDatabase. Not written if outputdir/filename is None."""
+
+    if outputdir:
+      self.exporter = EventExporter(outputdir)
+    if filename:
+      self.exportDatabase = self.createDatabase(filename)
+
+  def hasEvent(self, event):
+    """Returns true if the given event is stored and not deleted"""
+
+    return event.eventSet is self
+
+  def compact(self):
+    """Removes the deleted events from the lists, the lists are replaced by new ones"""
+
+    if self.numDeleted > 0:
+      self.sequence = [ev for ev in self.sequence if ev.eventSet is self]
+      for k in self.keys():
+        self[k] = [ev for ev in self[k] if ev.eventSet is self]
+      self.numDeleted = 0
+      self.oldestPosition = 0
+
+  def archiveEvents(self):
+    """Moves the oldest events in memory into the archive database, until half of spillSize
+       events (at least the last one) are left in memory. Archived events stay stored: they
+       are read back by get_events, previousEvent, query_events and iterEvents, and their
+       changes are written into the archive."""
+
+    self.compact()
+    n = len(self.sequence) - max(self.spillSize // 2, 1)
+    events = self.sequence[:n]
+
+    if self.archive is None:
+      self.archive = sqlite3.connect("")    # Temporary database deleted when closed
+      self.archive.text_factory = str
+      self.archive.execute("CREATE TABLE archive (seqnum INTEGER PRIMARY KEY, name TEXT, "
+                           "timestamp TEXT, data BLOB)")
+      self.archive.execute("CREATE TABLE fields (seqnum INTEGER, name TEXT, value)")
+      self.archive.execute("CREATE INDEX archive_name ON archive (name, seqnum)")
+      self.archive.execute("CREATE INDEX fields_value ON fields (name, value)")
+      self.archive.execute("CREATE INDEX fields_seqnum ON fields (seqnum, name)")
+    self.archive.executemany("INSERT INTO archive VALUES (?, ?, ?, ?)",
+                             ((ev.seqnum, ev.eventType.name, ev.timestamp.isoformat(),
+                               self.archiveData(ev)) for ev in events))
+    self.archive.executemany("INSERT INTO fields VALUES (?, ?, ?)",
+                             ((ev.seqnum, k, self.databaseValue(v))
+                              for ev in events for (k, v) in ev.ufields.items()))
+    self.archive.commit()
+
+    # Removes the archived events from the lists and indexes in memory
+    for ev in events:
+      self.archivedEvents[ev.seqnum] = ev
+    self.archivedSeqnum = self.sequence[n].seqnum
+    self.sequence = self.sequence[n:]
+    for k in self.keys():
+      self[k] = self[k][self.bisectEvents(self[k], 'seqnum', self.archivedSeqnum):]
+    for index in self.indexes.values():
+      if index is None:
+        continue
+      for (value, l) in index.items():
+        del l[:self.bisectEvents(l, 'seqnum', self.archivedSeqnum)]
+        if len(l) == 0:
+          del index[value]
+    self.oldestPosition = 0
+
+  @staticmethod
+  def archiveData(event):
+    """Returns the data of the given event as stored in the archive database"""
+
+    return buffer(cPickle.dumps(event.toSpillRecord(), cPickle.HIGHEST_PROTOCOL))
+
+  def isArchived(self, event):
+    """Returns true if the given event is stored in the archive database"""
+
+    return self.archive is not None and event.seqnum < self.archivedSeqnum and \
+           event.eventSet is self
+
+  def storeArchived(self, event):
+    """Updates the data of the given event in the archive database if archived"""
+
+    if self.isArchived(event):
+      self.archive.execute("UPDATE archive SET data = ? WHERE seqnum = ?",
+                           (self.archiveData(event), event.seqnum))
+
+  def selectArchived(self, conditions=(), params=(), reverse=False):
+    """Returns an iterator on the archived events selected by the given SQL conditions on the
+       archive table with the values of their parameters, in sequence number order (reversed
+       if reverse). The events are read by chunks, such that they can be changed or deleted
+       while iterating."""
+
+    bound = None
+    while self.archive is not None:
+      sql = "SELECT seqnum, data FROM archive"
+      conds = list(conditions)
+      values = list(params)
+      if bound is not None:
+        conds.append("seqnum < ?" if reverse else "seqnum > ?")
+        values.append(bound)
+      if len(conds) > 0:
+        sql += " WHERE " + " AND ".join(conds)
+      sql += " ORDER BY seqnum" + (" DESC" if reverse else "") + \
+             " LIMIT " + str(self.archiveChunkSize)
+      rows = self.archive.execute(sql, values).fetchall()
+
+      # The events of the chunk are all read back first, so that the events deleted while
+      #  iterating are known as such
+      events = list()
+      for (seqnum, data) in rows:
+        ev = self.archivedEvents.get(seqnum)
+        if ev is None:
+          ev = Event.fromSpillRecord(self.eventTypes, cPickle.loads(str(data)))
+          ev.eventSet = self
+          self.archivedEvents[seqnum] = ev
+        events.append(ev)
+      for ev in events:
+        if ev.eventSet is self:
+          yield ev
+
+      if len(rows) < self.archiveChunkSize:
+        break
+      bound = rows[-1][0]
+
+  def iterEvents(self, name=None):
+    """Returns an iterator on the stored events with the given name (all events if None) in
+       sequence number order, including the archived ones"""
+
+    for ev in self.selectArchived(["name = ?"] if name is not None else [],
+                                  [name] if name is not None else []):
+      yield ev
+    for ev in list(self.sequence if name is None else self[name]):
+      if ev.eventSet is self:
+        yield ev
+
+  @staticmethod
+  def databaseValue(value):
+    """Returns the given field value as stored in database, i.e. as text if not a number"""
+
+    if value is None or isinstance(value, (basestring, int, long, float)):
+      return value
+    return str(value)
+
+  @staticmethod
+  def createDatabase(filename):
+    """Returns a connection to a new SQLite database file (replacing an existing file) with the
+       empty tables of events, see writeDatabase"""
+
+    if os.path.exists(filename):
+      os.remove(filename)
+
+    database = sqlite3.connect(filename)
+    database.text_factory = str
+    database.execute("CREATE TABLE events (seqnum INTEGER PRIMARY KEY, name TEXT, "
+                     "timestamp TEXT, path TEXT, line INTEGER, raw TEXT)")
+    database.execute("CREATE TABLE fields (seqnum INTEGER, name TEXT, value)")
+    return database
+
+  @staticmethod
+  def insertEvents(database, events):
+    """Inserts the given events (list or iterator) into the tables of the database"""
+
+    events = iter(events)
+    while True:
+      chunk = list(itertools.islice(events, EventSet.archiveChunkSize))
+      if len(chunk) == 0:
+        break
+      database.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                           ((ev.seqnum, ev.eventType.name, ev.timestamp.isoformat(),
+                             ev.path, ev.linenum, ev.raw) for ev in chunk))
+      database.executemany("INSERT INTO fields VALUES (?, ?, ?)",
+                           ((ev.seqnum, k, EventSet.databaseValue(ev.ufields[k]))
+                            for ev in chunk for k in ev.getUserFieldNames()))
+
+  def writeDatabase(self, filename):
+    """Writes the stored events into a new SQLite database file (replacing an existing file),
+       with one row per event in the 'events' table and one row per user field in the 'fields'
+       table, after the events already written since startExport. The database is then kept
+       open and up to date until closeDatabase is called."""
+
+    self.compact()
+    self.database = self.exportDatabase or self.createDatabase(filename)
+    self.exportDatabase = None
+    self.insertEvents(self.database, self.iterEvents())
+
+    # Indexes created once the tables are filled, faster than updating them at each insertion
+    self.database.execute("CREATE INDEX events_name ON events (name, timestamp)")
+    self.database.execute("CREATE INDEX events_timestamp ON events (timestamp)")
+    self.database.execute("CREATE INDEX fields_value ON fields (name, value)")
+    self.database.execute("CREATE INDEX fields_seqnum ON fields (seqnum, name)")
+    self.database.commit()
+
+  def storeField(self, event, fieldName):
+    """Updates the given user field of the event in the database if written, and in the
+       archive database if the event is archived"""
+
+    for database in [self.database, self.archive if self.isArchived(event) else None]:
+      if database is not None:
+        database.execute("DELETE FROM fields WHERE seqnum = ? AND name = ?",
+                         (event.seqnum, fieldName))
+        database.execute("INSERT INTO fields VALUES (?, ?, ?)",
+                         (event.seqnum, fieldName, self.databaseValue(event.ufields[fieldName])))
+    self.storeArchived(event)
+
+  def closeDatabase(self):
+    """Commits the last changes and closes the database if written"""
+
+    if self.database is not None:
+      self.database.commit()
+      self.database.close()
+      self.database = None
+
+  def previousEvent(self, event):
+    """Returns the stored event with the same name before the given one (possibly archived),
+       otherwise the last one removed by the retention limit, None if not found"""
+
+    events = self[event.eventType.name]
+    for i in xrange(self.bisectEvents(events, 'seqnum', event.seqnum) - 1, -1, -1):
+      if events[i].eventSet is self:
+        return events[i]
+
+    for ev in self.selectArchived(["name = ?", "seqnum < ?"],
+                                  [event.eventType.name, event.seqnum], True):
+      return ev
+
+    evicted = self.evictedEvents.get(event.eventType.name)
+    if evicted is not None and evicted.seqnum < event.seqnum:
+      return evicted
+
+    return None
+
+
+  @staticmethod
+  def bisectEvents(events, attribute, value, right=False):
+    """Returns the position of the first event of the given list, ordered by the given attribute,
+       where the attribute is greater than or equal to the value (strictly greater if right)"""
+
+    lo = 0
+    hi = len(events)
+    while lo < hi:
+      mid = (lo + hi) // 2
+      v = getattr(events[mid], attribute)
+      if v < value or (right and v == value):
+        lo = mid + 1
+      else:
+        hi = mid
+
+    return lo
+
+
+  @staticmethod
+  def getIndexedValue(event, fieldName):
+    """Returns the value of the user field, otherwise of the system field, with the given name
+       used to index the event, or Event.undefined if the event has no such field"""
+
+    if fieldName in event.ufields:
+      return event.ufields[fieldName]
+    f = Event.systemFieldFunctions.get(fieldName)
+    return f(event) if f is not None else Event.undefined
+
+
+  def getIndex(self, name, fieldName):
+    """Returns the index of the events with the given name (all events if None) per value of the
+       given field, built on first use, or None if the field cannot be indexed"""
+
+    key = (name, fieldName)
+    if key not in self.indexes:
+      index = dict()
+      try:
+        for ev in self.sequence if name is None else self[name]:
+          value = self.getIndexedValue(ev, fieldName)
+          if value is not Event.undefined and ev.eventSet is self:
+            index.setdefault(value, list()).append(ev)
+      except TypeError:
+        # Unhashable field value (set from Python code)
+        index = None
+      self.indexes[key] = index
+
+    return self.indexes[key]
+
+
+  def indexEvent(self, event, fieldName=None):
+    """Inserts the event into the existing indexes of the given field (all fields if None),
+       archived events are not indexed"""
+
+    if self.isArchived(event):
+      return
+    for key, index in self.indexes.items():
+      if index is None or key[0] not in [None, event.eventType.name] or \
+         (fieldName is not None and key[1] != fieldName):
+        continue
+      value = self.getIndexedValue(event, key[1])
+      if value is Event.undefined:
+        continue
+      try:
+        events = index.setdefault(value, list())
+      except TypeError:
+        self.indexes[key] = None
+        continue
+      events.insert(self.bisectEvents(events, 'seqnum', event.seqnum), event)
+
+
+  def unindexEvent(self, event, fieldName=None):
+    """Removes the event from the existing indexes of the given field (all fields if None)"""
+
+    if self.isArchived(event):
+      return
+    for key, index in self.indexes.items():
+      if index is None or key[0] not in [None, event.eventType.name] or \
+         (fieldName is not None and key[1] != fieldName):
+        continue
+      try:
+        events = index.get(self.getIndexedValue(event, key[1]))
+      except TypeError:
+        events = None
+      if events is None:
+        continue
+      i = self.bisectEvents(events, 'seqnum', event.seqnum)
+      if i < len(events) and events[i] is event:
+        del events[i]
+        if len(events) == 0:
+          del index[self.getIndexedValue(event, key[1])]
+
 
   def get_events(self, name=None, fields=None, before=None, limit=0):
     """Returns an iterator on the latest events in multi-criterion search. The
        function may raise exceptions if the parameters are invalid, or may return None if no
-       event was found. Events are searched in the full list (self.sequence) starting from the end.
+       event was found. Events are searched in the full list (self.sequence) starting from the end,
+       then in the archive database.
        Parameters:
        - name: name of the event, or search all events if no name given
        - before: given as a timestamp or event
@@ -593,36 +1119,90 @@ class EventSet(dict):
     if name is not None:
       assert name in self, "Given event name " + str(name) + " is not known in event set"
 
-    # Main loop into full list of events, or dedicated list if name is given
+    # Candidate events in sequence order: full list, dedicated list if name is given, or list
+    #  of events from the index of one of the given fields if possible
+    candidates = self.sequence if name is None else self[name]
+    if fields is not None:
+      for kf in sorted(fields.keys()):
+        index = self.getIndex(name, kf) if kf not in self.unindexedFields else None
+        if index is not None:
+          try:
+            candidates = index.get(fields[kf], [])
+            break
+          except TypeError:
+            pass
+
+    # Skips the candidates after the given reference, events are ordered by sequence number
+    #  and, if timeOrdered, by timestamp
+    end = len(candidates)
+    if before is not None:
+      if hasattr(before, "seqnum"):
+        end = self.bisectEvents(candidates, 'seqnum', before.seqnum)
+      if self.timeOrdered and hasattr(before, "timestamp"):
+        end = min(end, self.bisectEvents(candidates, 'timestamp', before.timestamp, True))
+      elif self.timeOrdered and hasattr(before, "utcfromtimestamp"):
+        end = min(end, self.bisectEvents(candidates, 'timestamp', before, True))
+
+    # Main loop into candidate events starting from the end
     num = 0
     # print ">>>sequence: ", map(id, self.sequence if name is None else self[name])
-    for ev in reversed(self.sequence if name is None else self[name]):
+    for i in xrange(end - 1, -1, -1):
+      if i >= len(candidates): continue   # Events can be deleted during iteration
+      ev = candidates[i]
+      if ev.eventSet is not self: continue
       # print ">>>>>>>cur event:", ev
-      isMatching = True
-
-      # Checks name
-      if name is not None and ev.eventType.name != name: isMatching = False
-
-      # Checks fields
-      if isMatching and fields is not None:
-        for kf in fields.keys():
-          if (kf not in ev.sfields and kf not in ev.ufields) or \
-             (kf in ev.ufields and ev.ufields[kf] != fields[kf]) or \
-             (kf in ev.sfields and ev.sfields[kf] != fields[kf]):
-            isMatching = False
-
-      # Checks before
-      if isMatching and before is not None:
-        if (hasattr(before, "timestamp") and before.timestamp < ev.timestamp) or \
-           (hasattr(before, "seqnum") and before.seqnum <= ev.seqnum) or \
-           (hasattr(before, "utcfromtimestamp") and before < ev.timestamp):
-         isMatching = False
-
-      # Final test
-      if isMatching:
+      if self.isMatching(ev, name, fields, before):
         yield ev
         num += 1
-        if num == limit: break
+        if num == limit: return
+
+    # Continues with the archived events, all before the events in memory, pre-selected by name,
+    #  sequence number and the first given user field
+    if self.archive is not None:
+      conds = list()
+      params = list()
+      if name is not None:
+        conds.append("name = ?")
+        params.append(name)
+      if before is not None and hasattr(before, "seqnum"):
+        conds.append("seqnum < ?")
+        params.append(before.seqnum)
+      for kf in sorted(fields.keys()) if fields is not None else []:
+        if kf not in Event.systemFieldFunctions:
+          conds.append("seqnum IN (SELECT seqnum FROM fields WHERE name = ? AND value IS ?)")
+          params.extend([kf, self.databaseValue(fields[kf])])
+          break
+      for ev in self.selectArchived(conds, params, True):
+        if self.isMatching(ev, name, fields, before):
+          yield ev
+          num += 1
+          if num == limit: return
+
+
+  @staticmethod
+  def isMatching(ev, name, fields, before):
+    """Returns true if the event matches the criteria of get_events"""
+
+    # Checks name
+    if name is not None and ev.eventType.name != name: return False
+
+    # Checks fields
+    if fields is not None:
+      for kf in fields.keys():
+        hasSystemField = ev.hasSystemField(kf)
+        if (not hasSystemField and kf not in ev.ufields) or \
+           (kf in ev.ufields and ev.ufields[kf] != fields[kf]) or \
+           (hasSystemField and Event.systemFieldFunctions[kf](ev) != fields[kf]):
+          return False
+
+    # Checks before
+    if before is not None:
+      if (hasattr(before, "timestamp") and before.timestamp < ev.timestamp) or \
+         (hasattr(before, "seqnum") and before.seqnum <= ev.seqnum) or \
+         (hasattr(before, "utcfromtimestamp") and before < ev.timestamp):
+        return False
+
+    return True
 
 
   def get_event(self, name=None, fields=None, before=None):
@@ -632,105 +1212,471 @@ class EventSet(dict):
 
     return None
 
+  def query_events(self, condition=None, params=(), limit=0):
+    """Returns an iterator on the events selected by an SQL condition on the 'events' table of
+       the database (e.g. "name = ? AND timestamp > ?"), in sequence number order, with the
+       values of the parameters given as a tuple. The database must have been written (i.e.
+       during the execution of wrapup code with a database file given)."""
+
+    if self.database is None:
+      raise Exception("No event database, a database file must be given for the search")
+
+    sql = "SELECT seqnum FROM events"
+    if condition:
+      sql += " WHERE " + condition
+    sql += " ORDER BY seqnum"
+    if limit > 0:
+      sql += " LIMIT " + str(int(limit))
+
+    # Rows are all read first, so that the events can be modified while iterating
+    for (seqnum,) in self.database.execute(sql, params).fetchall():
+      if seqnum < self.archivedSeqnum:
+        for ev in self.selectArchived(["seqnum = ?"], [seqnum]):
+          yield ev
+        continue
+      i = self.bisectEvents(self.sequence, 'seqnum', seqnum)
+      if i < len(self.sequence) and self.sequence[i].seqnum == seqnum and \
+         self.sequence[i].eventSet is self:
+        yield self.sequence[i]
+
 
   def sortEvents(self):
     """Sorts all events according to their timestamps and sequence number, then sets sequence
        numbers according to new ordering"""
 
-    # Reset list for all events
-    self.sequence = list()
-
-    # Sorts each list of stored events, and adds it to the main list
-    for l in self.values():
-      l.sort()
-      self.sequence.extend(l)
-
-    # Finally sorts all events in main list
-    self.sequence.sort()
+    # Sorts the main list, where events are in sequence number order
+    self.compact()
+    self.sequence.sort(key=Event.sortKey)
+
+    # Merges the archived events, read in chronological order, with the events in memory, all
+    #  stored again in the emptied lists (archived again into a new archive beyond spillSize)
+    if self.archive is not None:
+      (archive, archived, events) = (self.archive, self.archivedEvents, self.sequence)
+      self.archive = None
+      self.archivedSeqnum = 0
+      self.archivedEvents = weakref.WeakValueDictionary()
+      self.sequence = list()
+      for k in self.keys():
+        self[k] = list()
+      self.indexes = dict()
+      self.curSeqnum = 0
+
+      def readArchive():
+        for (seqnum, data) in archive.execute("SELECT seqnum, data FROM archive "
+                                              "ORDER BY timestamp, seqnum"):
+          ev = archived.get(seqnum)
+          if ev is None:
+            ev = Event.fromSpillRecord(self.eventTypes, cPickle.loads(str(data)))
+          yield (ev.timestamp, seqnum, ev)
+
+      for (timestamp, seqnum, ev) in heapq.merge(readArchive(), ((ev.timestamp, ev.seqnum, ev)
+                                                                 for ev in events)):
+        self.add_event(ev)
+      archive.close()
+      self.timeOrdered = True
+      return
 
     # Re-compute sequence numbers
-    for i in range(len(self.sequence)):
-      self.sequence[i].setSeqnum(i)
+    for (i, ev) in enumerate(self.sequence):
+      ev.seqnum = i
 
-    return self.sequence
+    # Sorts each list of stored events, also in sequence number order
+    for l in self.values():
+      l.sort(key=Event.sortKey)
+
+    # Indexes are re-built on next use with the new order
+    self.indexes = dict()
+    self.timeOrdered = True
 
 
   def finalizeEvents(self, executionContext):
     """Deferred execution of Python code and parsing of display strings for chronological search"""
 
     # Executes the python code of all the events in the sequence
-    # Needs full list and references to index because events can be deleted during execution
-    fullseq = list(self.sequence)
-    for e in fullseq:
-      if e in self.sequence and not e.eventType.immediate:
+    # Events can be deleted during execution, see iterEvents
+    for e in self.iterEvents():
+      if self.hasEvent(e) and not e.eventType.immediate:
         e.execute(executionContext)
 
-    # Creates display strings of each event in each list
-    for l in self.values():
-      prev = None
-      for ev in l:
-        ev.parseDisplay(prev, self)
-        prev = ev
+    # Creates display strings of each event using the previous one with the same name
+    self.compact()
+    prev = dict()
+    for ev in self.iterEvents():
+      ev.parseDisplay(prev.get(ev.eventType.name), self)
+      prev[ev.eventType.name] = ev
+      self.storeArchived(ev)
+    if self.archive is not None:
+      self.archive.commit()
 
 
   def save(self, outputdir):
-    """Saves the content of the events into XML/CSV files in outputdir"""
+    """Saves the content of the events into XML/CSV files in outputdir, after the events
+       already written since startExport"""
 
     # Creates 1 CSV and 2 XML files per event name, one simplified and one full
+    self.compact()
+    exporter = self.exporter or EventExporter(outputdir)
+    self.exporter = None
     for k in self.keys():
-      for ext in [".xml", ".full.xml", ".csv"]:
+      for ev in self.iterEvents(k):
+        exporter.write(ev)
+      exporter.closeFiles(k)
+
+
+class EventExporter:
+  """Writer of the XML/CSV export files of events, 1 CSV and 2 XML files (one simplified and one
+     full) per event name, written event by event (own file creation to avoid keeping whole
+     file in memory). The files of an event name are created with its first event."""
+
+  def __init__(self, outputdir):
+    """Inits the exporter with the output directory"""
+
+    self.outputdir = outputdir
+    self.files = dict()             # (CSV file, XML file, full XML file) per event name
+    self.csvFields = dict()         # CSV columns per event name
+
+  def openFiles(self, name, ufsel):
+    """Creates the files of the given event name, with ufsel as the user fields of the CSV"""
+
+    files = tuple(open(os.path.join(self.outputdir, name + ext), "w")
+                  for ext in [".csv", ".xml", ".full.xml"])
+    self.files[name] = files
+    self.csvFields[name] = ["_timestamp", "_name", "_display_on_match", "_changed_fields",
+                            "_flat"] + ufsel
+
+    # CSV Header
+    for s in self.csvFields[name]: files[0].write(s + ";")
+    files[0].write("\n")
+
+    # XML Header
+    for f in files[1:]:
+      f.write("<?xml version='1.0' encoding='utf-8'?>\n<RegulogEvents>\n")
+
+  def write(self, ev):
+    """Writes the given event at the end of the files of its event name"""
+
+    name = ev.eventType.name
+    if name not in self.files:
+      self.openFiles(name, sorted(ev.ufields.keys()))
+    (csv, xml, fullxml) = self.files[name]
+
+    # Export event
+    def trans(s): return "" if s is None else s.replace("\n", " ").replace(";", " ")
+    for kf in self.csvFields[name]:
+      csv.write(trans(ev.get_field(kf) if ev.has_field(kf) else None) + ";")
+    csv.write("\n")
+    xml.write("  " + ET.tostring(ev.toXML(False)) + "\n")
+    fullxml.write("  " + ET.tostring(ev.toXML(True)) + "\n")
+
+  def closeFiles(self, name):
+    """Ends and closes the files of the given event name, created empty if no event written"""
+
+    if name not in self.files:
+      self.openFiles(name, [])
+    files = self.files.pop(name)
+
+    # XML End of file
+    for f in files[1:]:
+      f.write("</RegulogEvents>\n")
+    for f in files:
+      f.close()
+
+
+class LiteralPrefilter:
+  """Pre-selection of event types per line of text, based on literal strings that must appear in
+     any text matched by the text regexp of the event types. All literals are searched in one
+     pass per line using a single regexp shaped as a trie (Aho-Corasick style), then only the
+     event types for which a literal was found need their full text regexp to be searched."""
+
+  # Literals shorter than this are not selective enough to be worth a pre-selection
+  minLiteralLength = 3
+
+  @staticmethod
+  def getRequiredLiterals(compiledRex):
+    """Returns a frozenset of strings such that at least one of them is part of any text matched
+       by the compiled regexp, or None if no usable set of literal strings could be found"""
+
+    # Locale dependent patterns cannot be analysed reliably
+    if compiledRex.flags & re.LOCALE:
+      return None
+    try:
+      parsed = sre_parse.parse(compiledRex.pattern, compiledRex.flags)
+    except Exception:
+      return None
+
+    # Helper function returning the most selective set, i.e. with the longest shortest literal
+    def getBest(sets):
+      sets = [s for s in sets if len(s) > 0]
+      return max(sets, key=lambda s: min(map(len, s))) if len(sets) > 0 else None
+
+    # Helper function returning the list of literal sets all required in a sequence of items
+    def getRequired(items):
+      res = list()
+      run = list()
+      for op, av in items:
+        if op == sre_constants.LITERAL and av < 256:
+          run.append(chr(av))
+          continue
+        # Anchors do not consume text, hence do not break the current run of literals
+        if op == sre_constants.AT:
+          continue
+        if len(run) > 0:
+          res.append(frozenset([''.join(run)]))
+          run = list()
+        if op == sre_constants.SUBPATTERN:
+          res.extend(getRequired(av[-1]))
+        elif op in [sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT] and av[0] >= 1:
+          res.extend(getRequired(av[2]))
+        elif op == sre_constants.BRANCH:
+          # One literal of each alternative is required, the union of them is then required
+          alternatives = [getBest(getRequired(b)) for b in av[1]]
+          if None not in alternatives:
+            res.append(frozenset().union(*alternatives))
+      if len(run) > 0:
+        res.append(frozenset([''.join(run)]))
+      return res
 
-        # Creates XML file (own file creation to avoid keeping whole file in memory)
-        filename = os.path.join(outputdir, k + ext)
-        with open(filename, "w") as f:
+    best = getBest(getRequired(parsed))
+    if best is None or min(map(len, best)) < LiteralPrefilter.minLiteralLength:
+      return None
 
-          # CSV export
-          if ext is ".csv" :
-            sfsel = ["_timestamp", "_name", "_display_on_match", "_changed_fields", "_flat"]
-            ufsel = sorted(self[k][0].ufields.keys()) if len(self[k])>0 else []
+    # Case-insensitive literals are handled in lower case, restricted to ASCII for safe folding
+    if compiledRex.flags & re.IGNORECASE:
+      if any(ord(c) > 127 for l in best for c in l):
+        return None
+      best = frozenset(l.lower() for l in best)
 
-            # CSV Header
-            for s in sfsel + ufsel: f.write(s + ";")
-            f.write("\n")
+    return best
 
-            # Export events
-            def trans(s): return "" if s is None else s.replace("\n", " ").replace(";", " ")
-            for ev in self[k]:
-              for kf in sfsel + ufsel:
-                f.write(trans(ev.get_field(kf) if ev.has_field(kf) else None) + ";")
-              f.write("\n")
 
-          # XML export
-          else:
-            # XML Header
-            f.write("<?xml version='1.0' encoding='utf-8'?>\n<RegulogEvents>\n")
+  def __init__(self, eventTypes):
+    """Builds the search structures for the given list of EventType objects, where event types
+       without usable literals (or multiline ones) are left out and have to be searched anyway"""
+
+    # Names of the event types that can be rejected by this prefilter
+    self.names = set()
+
+    # One scanner for each case sensitivity: (compiled trie regexp, dict literal -> set of names)
+    self.scanners = list()
+    for ignoreCase in [False, True]:
+      owners = dict()
+      for evt in eventTypes:
+        if evt.requiredLiterals is None or \
+           bool(evt.compiledRexText.flags & re.IGNORECASE) != ignoreCase:
+          continue
+        self.names.add(evt.name)
+        for l in evt.requiredLiterals:
+          owners.setdefault(l, set()).add(evt.name)
+      if len(owners) == 0:
+        continue
+
+      # The trie regexp returns the longest literal at a position, the shorter literals found at
+      #  the same position are its prefixes, so each literal is mapped to all its prefix owners
+      outputs = dict()
+      for l in owners:
+        outputs[l] = set()
+        for i in range(1, len(l) + 1):
+          outputs[l] |= owners.get(l[:i], set())
+
+      rex = re.compile(self.getTrieRegexp(owners.keys()), re.IGNORECASE if ignoreCase else 0)
+      self.scanners.append((rex, outputs, ignoreCase))
+
+
+  def getTrieRegexp(self, literals):
+    """Returns a regexp string matching any of the given literals, factorized as a trie such
+       that the longest literal is matched at a given position"""
+
+    # Builds trie as nested dicts, empty key marks the end of a literal
+    trie = dict()
+    for l in literals:
+      node = trie
+      for c in l:
+        node = node.setdefault(c, dict())
+      node[''] = None
+
+    def getRegexp(node):
+      alternatives = [re.escape(c) + getRegexp(node[c]) for c in sorted(node) if c != '']
+      if len(alternatives) == 0:
+        return ''
+      res = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+      return '(?:' + res + ')?' if '' in node else res
+
+    return getRegexp(trie)
+
+
+  def getRejectedNames(self, line):
+    """Returns the set of names of event types which text regexp cannot match the given line"""
+
+    found = set()
+    for rex, outputs, ignoreCase in self.scanners:
+      m = rex.search(line)
+      while m:
+        found |= outputs[m.group().lower() if ignoreCase else m.group()]
+        m = rex.search(line, m.start() + 1)
+
+    return self.names - found
+
+
+class CombinedPrefilter:
+  """Pre-selection of event types per line of text, where the text regexps of all event types
+     are combined into one single regexp searched once per line. Each event type is a branch
+     of the combined regexp with its own dispatch group, set if the branch matched, such that
+     the original regexp only needs to be searched (for fields extraction) if its branch hit."""
+
+  # Maximum number of branches per combined regexp (the re module supports 100 groups)
+  maxBranches = 90
+
+  @staticmethod
+  def getUncapturedRegexp(compiledRex):
+    """Returns the text regexp with all capturing groups turned into non-capturing ones, or None
+       if the regexp cannot be used as a branch (back-references, inline flags)"""
+
+    try:
+      parsed = sre_parse.parse(compiledRex.pattern)
+    except Exception:
+      return None
+    if parsed.pattern.flags != 0 or \
+       '(?P=' in compiledRex.pattern or re.search(r"\\[1-9]|\(\?\(", compiledRex.pattern):
+      return None
+
+    # Walks the pattern string, skipping escaped characters and character sets
+    rex = compiledRex.pattern
+    res = ''
+    i = 0
+    while i < len(rex):
+      c = rex[i]
+      if c == '\\':
+        res += rex[i:i+2]
+        i += 2
+        continue
+      if c == '[':
+        j = i + 1
+        if j < len(rex) and rex[j] == '^': j += 1
+        if j < len(rex) and rex[j] == ']': j += 1
+        while j < len(rex) and rex[j] != ']':
+          j += 2 if rex[j] == '\\' else 1
+        res += rex[i:j+1]
+        i = j + 1
+        continue
+      if c == '(' and rex.startswith('(?P<', i):
+        res += '(?:'
+        i = rex.index('>', i) + 1
+        continue
+      if c == '(' and not rex.startswith('(?', i):
+        res += '(?:'
+        i += 1
+        continue
+      res += c
+      i += 1
+
+    # Checks that the result is still a valid regexp without any group
+    try:
+      if re.compile(res, compiledRex.flags).groups != 0:
+        return None
+    except Exception:
+      return None
+
+    return res
 
-            # Adds events to XML data
-            for ev in self[k]:
-              xev = ev.toXML("full" in ext)
-              f.write("  " + ET.tostring(xev) + "\n")
 
-            # XML End of file
-            f.write("</RegulogEvents>\n")
+  def __init__(self, eventTypes):
+    """Builds the combined regexps for the given list of EventType objects, where event types
+       that cannot be combined (or multiline ones) are left out and have to be searched anyway"""
+
+    # Names of the event types that can be rejected by this prefilter
+    self.names = set()
+
+    # List of (compiled combined regexp, list of event type names in order of dispatch groups)
+    self.combined = list()
+    for ignoreCase in [False, True]:
+      branches = list()
+      for evt in eventTypes:
+        if evt.multilineCount > 1 or bool(evt.compiledRexText.flags & re.IGNORECASE) != ignoreCase:
+          continue
+        rex = self.getUncapturedRegexp(evt.compiledRexText)
+        if rex is not None:
+          self.names.add(evt.name)
+          branches.append((evt.name, rex))
+
+      # Each branch is an optional look-ahead searching the whole line, followed by an empty
+      #  dispatch group that participates in the match only if the look-ahead succeeded
+      for i in range(0, len(branches), self.maxBranches):
+        chunk = branches[i:i + self.maxBranches]
+        rex = ''.join(r"(?:(?=[\s\S]*?(?:" + r + "))())?" for (n, r) in chunk)
+        self.combined.append((re.compile(rex, re.IGNORECASE if ignoreCase else 0),
+                              [n for (n, r) in chunk]))
+
+
+  def getRejectedNames(self, line):
+    """Returns the set of names of event types which text regexp does not match the given line"""
+
+    # Dispatch groups that did not participate get the default value 1, others are empty
+    rejected = set()
+    for rex, names in self.combined:
+      rejected.update(itertools.compress(names, rex.match(line).groups(1)))
+
+    return rejected
 
 
 class EventSearchContext(dict):
 
-  def __init__(self, verbosity, eventTypes, chronological, outputdir):
+  def __init__(self, verbosity, eventTypes, chronological, outputdir, searchEngine='regex',
+               workerMode=False, streamWindow=0, spillSize=0, database=None, timeFrom=None,
+               timeTo=None, indexDirectory=None, checkpointFile=None, retention=0):
+    """Inits the search context. In worker mode (parallel search or chronological merge), the
+       found events are only completed and returned by checkLine, without being stored nor
+       executing Python code. If chronological and streamWindow is greater than 0, events are
+       merged in chronological order during the search, see mergeEvents. Stored events beyond
+       spillSize events are spilled to disk if spillSize is greater than 0, see EventSet (not
+       with a retention limit or stream window). If a database file is given, the events are
+       written into it before the wrapup code. Only the events with a timestamp between
+       timeFrom and timeTo (if given) are stored. The time indexes of the log files are kept in
+       indexDirectory if given, see LogSource.getTimeIndex. If a checkpoint file is given, the
+       search is incremental, see LogSource.searchLogFileIncrement. Beyond retention stored
+       events (if greater than 0), the oldest events are deleted. Events merged during the
+       search are written into the export files and database as they are removed, beyond
+       retention events (streamWindow events if 0), such that they are not all kept in memory."""
 
     # Internal variables
     self.verbosity = verbosity
     self.eventTypes = eventTypes
     self.chronological = chronological
+    self.searchEngine = searchEngine   # 'regex' (with literal prefilter) or 'combined'
+    self.workerMode = workerMode
+    self.transferEvents = workerMode   # Keeps texts used to create events, see Event.toRecord
+    self.streamWindow = streamWindow if chronological else 0
+    self.database = database           # SQLite database file written on wrapup, or None
+    self.timeFrom = timeFrom           # Start of the time window (datetime), or None
+    self.timeTo = timeTo               # End of the time window (datetime), or None
+    self.indexDirectory = indexDirectory # Directory of the time indexes of log files, or None
+    self.checkpointFile = checkpointFile # File of checkpoints of incremental search, or None
+
+    # Checkpoints per pseudo-path of log files, of the previous search and of this search
+    self.previousCheckpoints = self.loadCheckpoints() if checkpointFile and not workerMode \
+                               else dict()
+    self.checkpoints = dict()
+
+    # Number of zip members read at the same time by a chronological merge, and temporary file
+    #  of the events of the log files searched completely (see LogSource.spillEvents)
+    self.numOpenStreams = 0
+    self.runFile = None
 
     # Used to display advancement
     self.numProcessedLines = 0
     self.numFoundEvents = 0
     self.lastPrintedAdvancement = datetime.datetime.now()
     self.lastNumProcessedLines = 0
+    self.nextCheckedNumLines = 0
+
+    # Literal or combined prefilters, one per set of event type names selected for a source file
+    self.prefilters = dict()
 
     # Creates main structure holding events, i.e. dict of lists of events, key is event name
-    self.events = EventSet(self.eventTypes)
+    if self.streamWindow > 0 and not workerMode:
+      self.events = EventSet(self.eventTypes, 0, retention or self.streamWindow)
+      self.events.startExport(outputdir, database)
+    else:
+      self.events = EventSet(self.eventTypes, spillSize, retention)
 
     # Creates execution context
     self.executionContext = ExecutionContext(self.events, self.eventTypes)
@@ -739,14 +1685,20 @@ class EventSearchContext(dict):
     d = dict(verbosity=verbosity, output_directory = outputdir, chronological=chronological)
     self.executionContext.setLocalVariables(d)
     for evt in self.eventTypes.values():
-      self.executionContext.execute('Init', evt.name)
+      if not self.workerMode:
+        self.executionContext.execute('Init', evt.name)
 
 
   def printAdvancement(self, currentLogPath):
     """Prints statistics information every 30 seconds"""
 
+    # Statistics are printed by the main process only
+    if self.workerMode:
+      return
+
     # Checks only every 10000 lines
-    if self.numProcessedLines % 10000 == 0:
+    if self.numProcessedLines >= self.nextCheckedNumLines:
+      self.nextCheckedNumLines = self.numProcessedLines + 10000
 
       # Prints if the time delta exceeds 30 seconds
       dt = (datetime.datetime.now() - self.lastPrintedAdvancement).seconds
@@ -768,10 +1720,46 @@ class EventSearchContext(dict):
             self.numFoundEvents, "events -", int(mem / (1024*1024)), "MBytes -", \
             "Now at", currentLogPath
 
+  def checkFileTime(self, fileTime):
+    """Returns true if a log file last modified at the given time may contain lines in the time
+       window, i.e. if it was not last modified before the start of the window"""
+
+    # Modification times are truncated to the second
+    return self.timeFrom is None or fileTime + datetime.timedelta(seconds=1) > self.timeFrom
+
+  def isInTimeWindow(self, timestamp):
+    """Returns true if the given timestamp is in the time window"""
+
+    return (self.timeFrom is None or timestamp >= self.timeFrom) and \
+           (self.timeTo is None or timestamp <= self.timeTo)
+
+  def getLineTime(self, line):
+    """Returns the timestamp of the given line of the current source file according to the
+       timestamp regexps of the selected event types, None if no timestamp was found"""
+
+    lineTimestamps = dict()
+    for evt in self.searchEventTypes:
+      try:
+        return self.parseLineTimestamp(lineTimestamps, line, evt)[0]
+      except ValueError:
+        pass
+
+    return None
+
+  def selectsSource(self, filePath, fileTime):
+    """Returns true if the given log file is selected by checkSource, without preparing the
+       search nor executing Python code"""
+
+    return self.checkFileTime(fileTime) and \
+           any(evt.searchFilename(filePath) for evt in self.eventTypes.values())
+
   def checkSource(self, filePath, fileTime):
     """Checks if file path is matching at least one event type, then prepares internal structures.
        Timestamp on file is given in order to get Year value if missing in the timestamp
-       definition."""
+       definition. Files last modified before the time window are not selected."""
+
+    if not self.checkFileTime(fileTime):
+      return False
 
     self.searchFilePath = filePath
     self.searchFileTime = fileTime
@@ -785,15 +1773,29 @@ class EventSearchContext(dict):
         self.searchEventTypes.append(evt)
 
         # Executes the related execOnFile code for this event type
-        d = dict(source_filename=os.path.basename(filePath), source_path=filePath)
-        self.executionContext.setLocalVariables(d)
-        self.executionContext.execute('File', evt.name)
+        if not self.workerMode:
+          d = dict(source_filename=os.path.basename(filePath), source_path=filePath)
+          self.executionContext.setLocalVariables(d)
+          self.executionContext.execute('File', evt.name)
 
     # Prepares structures and returns true if at least one event matched
     if len(self.searchEventTypes) > 0:
 
+      # Gets prefilter for this set of event types according to engine (created once per set)
+      key = frozenset(evt.name for evt in self.searchEventTypes)
+      if key not in self.prefilters:
+        if self.searchEngine == 'combined':
+          prefilter = CombinedPrefilter(self.searchEventTypes)
+        else:
+          prefilter = LiteralPrefilter(self.searchEventTypes)
+        self.prefilters[key] = prefilter if len(prefilter.names) > 0 else None
+      self.searchPrefilter = self.prefilters[key]
+
       # Prepares buffer of log text strings for multiline log entries support
       self.lines = collections.deque(maxlen=100) # Previous lines to scan for timestamp
+      self.multilines = dict()                   # Joined previous lines per number of lines
+      self.lineTimestamps = collections.deque(maxlen=100) # Timestamp cache of previous lines
+      self.timestampSelectors = dict()           # Timestamp branch selection per timestamp regexp
       self.unfinishedEvents = dict()             # Events while looking for following timestamp
       self.linenum = 0                           # Current line number in source file
 
@@ -803,17 +1805,63 @@ class EventSearchContext(dict):
 
 
   def getMultiline(self, num):
-    """Returns a string built of the most recent num lines starting backwards"""
-    # Packs all lines from event into one
-    res = ''
-    for i in range(min(num, len(self.lines))):
-      res = self.lines[i] + ('\n' if i > 0 else '') + res
+    """Returns a string built of the most recent num lines starting backwards. The string is
+       joined once per number of lines and kept until the next line is added."""
+
+    # Packs all lines from event into one, oldest line first
+    res = self.multilines.get(num)
+    if res is None:
+      res = '\n'.join(reversed(list(itertools.islice(self.lines, 0, num))))
+      self.multilines[num] = res
 
     return res
 
 
+  def searchLineTimestamp(self, lineTimestamps, line, eventType):
+    """Returns the cached timestamp regexp search result of the event type in the given line,
+       where lineTimestamps is the timestamp cache of the line (dict with the timestamp regexp as
+       key, so that the cache is shared by event types with the same timestamp regexp). The
+       result is a list with the match result, the timestamp data (None if not computed yet,
+       False if no timestamp could be computed) and the TimestampDecoder of the match result."""
+
+    res = lineTimestamps.get(eventType.rexTimestamp)
+    if res is None:
+
+      # Searches with the branch of the timestamp regexp selected for the source file
+      selector = self.timestampSelectors.get(eventType.rexTimestamp)
+      if selector is None:
+        selector = TimestampSelector(eventType)
+        self.timestampSelectors[eventType.rexTimestamp] = selector
+      (ts, decoder) = selector.search(line)
+      res = [ts, None, decoder]
+      lineTimestamps[eventType.rexTimestamp] = res
+
+    return res
+
+
+  def parseLineTimestamp(self, lineTimestamps, line, eventType):
+    """Returns the timestamp data of the given line (see EventType.getTimestampData), parsed at
+       most once per line and timestamp regexp, raises an exception if no timestamp was found"""
+
+    res = self.searchLineTimestamp(lineTimestamps, line, eventType)
+    if res[1] is None:
+      try:
+        assert res[0] is not None, "Timestamp regex does not match"
+        res[1] = res[2].decode(res[0], self.searchFileTime)
+      except Exception:
+        res[1] = False
+    if res[1] is False:
+      raise ValueError("No timestamp found in line")
+
+    return res[1]
+
+
   def storeNewEvent(self, ev, eventLinesCount):
-    """Completes event definition if not chronological and stores it into list of event"""
+    """Completes event definition if not chronological and stores it into list of event, returns
+       false if the event is dropped as out of the time window"""
+
+    if not self.isInTimeWindow(ev.timestamp):
+      return False
 
     # Packs all lines related to this event into one (at this stage the current line is not
     #  in the previous lines, eventLinesCount was updated previously).
@@ -823,22 +1871,33 @@ class EventSearchContext(dict):
     # Updates linenum using the event lines count, taking num of lines into account
     ev.setLinenum(self.linenum - (eventLinesCount+1))
 
+    # In worker mode, the event is stored later by the main process (see restoreEvents)
+    if not self.workerMode:
+      self.recordEvent(ev)
+
+    return True
+
+
+  def recordEvent(self, ev):
+    """Stores a completed event into lists of events, then executes Python code and creates
+       display string if not chronological"""
+
     # Adds created event to current lists
     self.events.add_event(ev)
     self.numFoundEvents += 1
 
     # Exec Python and creates display strings immediately using previous event if not chronological
-    if ev.eventType.immediate or not self.chronological:
+    #  or if events are recorded in chronological order
+    if ev.eventType.immediate or not self.chronological or self.streamWindow > 0:
 
       # Executes execOnMatch code
       ev.execute(self.executionContext)
 
       # Events can be deleted during execution (including the current one)
-      if ev in self.events[ev.eventType.name]:
+      if self.events.hasEvent(ev):
 
         # Determines previous event if any and computes display string
-        pev = self.events[ev.eventType.name][-2] if len(self.events[ev.eventType.name])>1 else None
-        ev.parseDisplay(pev, self.events)
+        ev.parseDisplay(self.events.previousEvent(ev), self.events)
 
 
   def checkLine(self, line, finishEvents=True):
@@ -846,6 +1905,9 @@ class EventSearchContext(dict):
        called with 'line' set to None to finish current multiline treatment. If finishEvents is
        false, then acquires events without waiting for next line with timestamp."""
 
+    # Timestamp cache of the current line, stored with the line in the multiline buffer
+    lineTimestamps = dict()
+
     # Handles unfinished events that were created during previous calls, i.e. check if the
     #   current line contains a timestamp applicable for this event type found in previous lines
     if len(self.unfinishedEvents) > 0:
@@ -854,14 +1916,12 @@ class EventSearchContext(dict):
 
         # Checks if the current line contains a timestamp or it is the last line (line=None),
         #  i.e. completes the fields and stores the event
-        if line is None or ev.eventType.searchTimestamp(line):
-
-          # Completes fields and stores new event
-          self.storeNewEvent(ev, self.eventLinesCount)
+        if line is None or self.searchLineTimestamp(lineTimestamps, line, ev.eventType)[0]:
 
-          # Removes this event from the list and returns it
+          # Removes this event from the list, completes fields, stores and returns the event
           del self.unfinishedEvents[ev.eventType.name]
-          yield ev
+          if self.storeNewEvent(ev, self.eventLinesCount):
+            yield ev
 
       # In any case increases the number of lines belonging to these events, created before
       self.eventLinesCount += 1
@@ -872,13 +1932,18 @@ class EventSearchContext(dict):
 
       # Stores line in multiline buffer
       self.lines.appendleft(line)
+      self.lineTimestamps.appendleft(lineTimestamps)
+      self.multilines.clear()
 
       # Updates current line number in source (pre-incrementation)
       self.linenum += 1
 
+      # Gets event types that cannot match this line according to the prefilter
+      rejected = self.searchPrefilter.getRejectedNames(line) if self.searchPrefilter else ()
+
       # Search for known event types in given line, only if there is no unfinished event on-going
       for evt in self.searchEventTypes:
-        if evt.name not in self.unfinishedEvents:
+        if evt.name not in self.unfinishedEvents and evt.name not in rejected:
 
           # Creates string with the current and previous lines for multiline patterns
           multiline = line if evt.multilineCount == 1 else self.getMultiline(evt.multilineCount)
@@ -899,9 +1964,9 @@ class EventSearchContext(dict):
             #  eventLinesCount accordingly (reset to 1 if not found)
             timestampFound = False
             self.eventLinesCount = 1
-            for l in self.lines:
+            for (l, lts) in itertools.izip(self.lines, self.lineTimestamps):
               try:
-                ev.parseTimestamp(l, sourceTime=self.searchFileTime)
+                ev.setTimestampData(self.parseLineTimestamp(lts, l, evt))
                 timestampFound = True
                 break
               except:
@@ -909,6 +1974,10 @@ class EventSearchContext(dict):
             else:
               self.eventLinesCount = 1
 
+            # Keeps the texts used to create the event for transfer to the main process
+            if self.transferEvents:
+              ev.setMatchedTexts(multiline, self.lines[self.eventLinesCount - 1]
+                                            if timestampFound else None)
 
             # If no timestamp could be found, at least prints a detailed description of the issue
             #   during the timestamp parsing process
@@ -925,8 +1994,8 @@ class EventSearchContext(dict):
             #  chance that a timestamp will be found in the next lines if no one was found in the
             #  previous lines)
             if not finishEvents or not timestampFound:
-              self.storeNewEvent(ev, self.eventLinesCount)
-              yield ev
+              if self.storeNewEvent(ev, self.eventLinesCount):
+                yield ev
 
             # Inserts event into list of unfinished events for later processing
             else:
@@ -938,18 +2007,156 @@ class EventSearchContext(dict):
       self.numProcessedLines += 1
 
 
+  def restoreEvents(self, numLines, records, lineOffset=0):
+    """Stores the events found by a worker process in a log file, given as a list of event
+       records with the number of processed lines, and returns them as checkLine. The line
+       numbers of the events are shifted by lineOffset (search of a byte range)."""
+
+    self.numProcessedLines += numLines
+    for record in records:
+      ev = Event.fromRecord(self.eventTypes, record, self.searchFileTime)
+      if lineOffset:
+        ev.setLinenum(ev.linenum + lineOffset)
+      if self.transferEvents:
+        ev.setMatchedTexts(record[4], record[5])
+      self.recordEvent(ev)
+      yield ev
+
+
+  def getCheckpointKey(self):
+    """Returns a key of the event types, checkpoints are not valid for other event types"""
+
+    xml = [ET.tostring(self.eventTypes[k].toXML()) for k in sorted(self.eventTypes.keys())]
+    return hashlib.sha1('\n'.join(xml)).hexdigest()
+
+  def loadCheckpoints(self):
+    """Returns the checkpoints stored in the checkpoint file, empty if not found or if the
+       event types have changed"""
+
+    if os.path.isfile(self.checkpointFile):
+      with open(self.checkpointFile, 'rb') as f:
+        (key, checkpoints) = cPickle.load(f)
+      if key == self.getCheckpointKey():
+        return checkpoints
+      print "\nEvent types changed since last incremental search, log files searched again"
+
+    return dict()
+
+  def saveCheckpoints(self):
+    """Stores the checkpoints of this search into the checkpoint file, with the checkpoints of
+       the previous search for log files not searched this time"""
+
+    checkpoints = dict(self.previousCheckpoints)
+    checkpoints.update(self.checkpoints)
+    tmpname = self.checkpointFile + "." + str(os.getpid())
+    with open(tmpname, 'wb') as f:
+      cPickle.dump((self.getCheckpointKey(), checkpoints), f, cPickle.HIGHEST_PROTOCOL)
+    if os.path.exists(self.checkpointFile):
+      os.remove(self.checkpointFile)
+    os.rename(tmpname, self.checkpointFile)
+
+  def getResumeState(self):
+    """Returns the state of the search in the current source file, i.e. line number, multiline
+       buffer (oldest line first), number of lines and records of the unfinished events"""
+
+    pending = [ev.toPendingRecord() for ev in self.unfinishedEvents.values()]
+    return (self.linenum, list(reversed(self.lines)),
+            self.eventLinesCount if len(pending) > 0 else 0, pending)
+
+  def resumeState(self, state):
+    """Resumes the search in the current source file with the state given by getResumeState"""
+
+    (linenum, lines, eventLinesCount, pending) = state
+    self.resetLines(lines, linenum)
+    self.eventLinesCount = eventLinesCount
+    for record in pending:
+      ev = Event.fromPendingRecord(self.eventTypes, record)
+      self.unfinishedEvents[ev.eventType.name] = ev
+
+
+  def getFileContext(self):
+    """Returns a shallow copy of this search context in worker mode, sharing the prefilters,
+       checkpoints and events of this context, used to search a log file on its own during a
+       chronological merge (the search state of the file is set by checkSource)"""
+
+    context = copy.copy(self)
+    context.workerMode = True
+    context.transferEvents = False
+    context.numProcessedLines = 0
+
+    return context
+
+
+  def mergeEvents(self, streams):
+    """Stores the events of the given event streams (iterators on the events of log files searched
+       at the same time, see LogSource.getEventStreams) in chronological order, and returns them
+       as checkLine. Events of a stream are re-ordered within a window of streamWindow events,
+       then the streams are merged, such that only the windows are kept in memory. Events with
+       the same timestamp are kept in the order of the streams, then in the order of the
+       stream, as during a sort of all events."""
+
+    # Generator of (timestamp, stream index, position in stream, event) re-ordered by timestamp
+    def reorder(index, events):
+      window = list()
+      for (pos, ev) in enumerate(events):
+        heapq.heappush(window, (ev.timestamp, index, pos, ev))
+        if len(window) > self.streamWindow:
+          yield heapq.heappop(window)
+      while len(window) > 0:
+        yield heapq.heappop(window)
+
+    for (timestamp, index, pos, ev) in heapq.merge(*[reorder(i, events)
+                                                     for (i, events) in enumerate(streams)]):
+      self.recordEvent(ev)
+      yield ev
+      self.printAdvancement(ev.path)
+
+    if self.runFile is not None:
+      self.runFile.close()
+      self.runFile = None
+
+
+  def resetLines(self, lines, linenum):
+    """Resets the search state within the current source file, with the given lines (oldest
+       first) as previous lines, linenum as current line number and no unfinished event"""
+
+    self.lines = collections.deque(reversed(lines), maxlen=self.lines.maxlen)
+    self.multilines.clear()
+    self.lineTimestamps = collections.deque([dict() for l in lines], maxlen=self.lines.maxlen)
+    self.unfinishedEvents = dict()
+    self.linenum = linenum
+
+
+  def checkLines(self, lines, finishEvents=True):
+    """Calls checkLine for each line of the given list of lines, returns the events as checkLine"""
+
+    for line in lines:
+      for ev in self.checkLine(line, finishEvents):
+        yield ev
+
+
   def wrapup(self, outputdir):
     """Sorts the events to display in chronological order, and save events in files if
-       the given outputdir is not None. Returns the full list of events if chronological
-       otherwise an empty list."""
+       the given outputdir is not None. Returns an iterator on all events if chronological and
+       not merged during the search, otherwise an empty list."""
 
     sl = list()
 
-    # Sorts and finalizes events if necessary
-    if self.chronological:
-      sl = self.events.sortEvents()
+    # Stores the checkpoints for the next incremental search
+    if self.checkpointFile:
+      self.saveCheckpoints()
+
+    # Sorts and finalizes events if necessary (already done for merged events)
+    if self.chronological and self.streamWindow == 0:
+      self.events.sortEvents()
       self.events.finalizeEvents(self.executionContext)
 
+    # Writes events into database, available for queries in wrapup Python code
+    if self.database:
+      print "\nWriting events into database"
+      self.events.writeDatabase(self.database)
+      self.executionContext.setLocalVariables(dict(database=self.events.database))
+
     # Executes wrapup Python code of event types
     for evt in self.eventTypes.values():
       self.executionContext.execute('Wrapup', evt.name)
@@ -958,10 +2165,273 @@ class EventSearchContext(dict):
     if outputdir:
       print "\nSaving events as XML/CSV"
       self.events.save(outputdir)
+    self.events.closeDatabase()
+
+    # Events deleted until now are not returned
+    if self.chronological and self.streamWindow == 0:
+      self.events.compact()
+      sl = self.events.iterEvents()
 
     return sl
 
 
+class TimestampDecoder:
+  """Decoder of the timestamp regexp match results of an event type. The named groups of the
+     regexp are analysed once, such that the decoding only needs the group indexes of the
+     timestamp fields. Recently built datetime objects are kept for re-use."""
+
+  # Month names, the first 3 letters of a month name given as text are used
+  months = {"JAN":1,"FEB":2,"MAR":3,"APR":4,"MAY":5,"JUN":6,
+            "JUL":7,"AUG":8,"SEP":9,"OCT":10,"NOV":11,"DEC":12}
+
+  # Maximum number of datetime objects kept for re-use
+  cacheSize = 4096
+
+  def __init__(self, compiledRex, names=None):
+    """Analyses the named groups of the compiled timestamp regexp. The group names can be given
+       in the order to use instead of the order of a groupdict result of a match."""
+
+    # Names of groups in the same order as in a groupdict result of a match
+    if names is None:
+      names = dict.fromkeys(compiledRex.groupindex.keys()).keys()
+
+    # Group indexes per timestamp field letter if group name syntax is as
+    #  _<letter><empty_or_digit>, in groupdict order (the last non-empty value is used)
+    self.indexes = list()
+    for letter in ['Y', 'M', 'D', 'h', 'm', 's']:
+      self.indexes.append([compiledRex.groupindex[k] - 1 for k in names
+                           if k[0] == '_' and len(k) in [2,3] and k[1] == letter and
+                           (len(k) == 2 or (len(k)==3 and k[2] >= "0" and k[2] <= "9"))])
+
+    # Additional fields (group names not starting with '_') with their group indexes
+    self.fields = [(k, compiledRex.groupindex[k] - 1) for k in names if k[0] != "_"]
+
+    # Datetime objects per timestamp field values
+    self.cache = dict()
+
+
+  def decode(self, ts, sourceTime=None):
+    """Returns a tuple with the timestamp as datetime, the span of the timestamp in text and the
+       list of additional fields (name, value) of the given regexp match result, see
+       EventType.getTimestampData"""
+
+    # Gets the last non-empty value of each timestamp field
+    groups = ts.groups()
+    values = list()
+    for indexes in self.indexes:
+      value = None
+      for i in indexes:
+        if groups[i]: value = groups[i]
+      values.append(value)
+    assert len(values) - values.count(None) >= 4, "Not enough timestamp fields"
+
+    # Year field may not be present in timestamp fields
+    if values[0] is None:
+      values[0] = sourceTime.year if sourceTime is not None else datetime.datetime.now().year
+
+    # Gets datetime from cache if already built for the same values
+    key = tuple(values)
+    timestamp = self.cache.get(key)
+    if timestamp is None:
+      (y, m, d, h, mi, sec) = values
+
+      # Year can be acquired as 2-digits (e.g. "31/12/16")
+      year = int(y)
+      if year < 100: year += 2000
+
+      # Month field may be given as text
+      month = int(m) if len(m) <= 2 else self.months[m[0:3].upper()]
+
+      # Second field may not be present
+      second = int(sec) if sec is not None else 0
+
+      timestamp = datetime.datetime(year, month, int(d), int(h), int(mi), second)
+      if len(self.cache) >= self.cacheSize:
+        self.cache.clear()
+      self.cache[key] = timestamp
+
+    # Returns the timestamp and additional fields
+    fields = [(k, groups[i]) for (k, i) in self.fields if groups[i] is not None]
+    return (timestamp, ts.span(), fields)
+
+
+class TimestampSelector:
+  """Selection of the timestamp regexp branch used in a source file. A timestamp regexp made of
+     alternatives anchored at the beginning of the line (e.g. the default one) is split into
+     branches, then the branch matching the first timestamps of the file is searched alone
+     for the next lines. The full regexp is searched again for lines where the branch does not
+     match, and the branch is selected again if another one matched."""
+
+  # Number of timestamps used to select the branch
+  sniffedCount = 10
+
+  # Analysed branches per timestamp regexp
+  branches = dict()
+
+  @staticmethod
+  def splitBranches(rex):
+    """Returns the list of top-level alternatives of the given regexp string"""
+
+    res = list()
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(rex):
+      c = rex[i]
+      if c == '\\':
+        i += 2
+        continue
+      if c == '[':
+        j = i + 1
+        if j < len(rex) and rex[j] == '^': j += 1
+        if j < len(rex) and rex[j] == ']': j += 1
+        while j < len(rex) and rex[j] != ']':
+          j += 2 if rex[j] == '\\' else 1
+        i = j + 1
+        continue
+      if c == '(': depth += 1
+      elif c == ')': depth -= 1
+      elif c == '|' and depth == 0:
+        res.append(rex[start:i])
+        start = i + 1
+      i += 1
+    res.append(rex[start:])
+
+    return res
+
+
+  @staticmethod
+  def getFirstChars(parsed):
+    """Returns the set of characters that can start a match of the given parsed regexp (after
+       anchors), or None if unknown or not restricted"""
+
+    # Characters per category (without locale or unicode flags)
+    categories = {sre_constants.CATEGORY_DIGIT: "0123456789",
+                  sre_constants.CATEGORY_SPACE: " \t\n\r\f\v",
+                  sre_constants.CATEGORY_WORD: "0123456789_abcdefghijklmnopqrstuvwxyz" +\
+                                               "ABCDEFGHIJKLMNOPQRSTUVWXYZ"}
+
+    for op, av in parsed:
+      if op is sre_constants.AT:
+        continue
+      if op is sre_constants.LITERAL:
+        return set([unichr(av)])
+      if op is sre_constants.IN:
+        res = set()
+        for iop, iav in av:
+          if iop is sre_constants.LITERAL:
+            res.add(unichr(iav))
+          elif iop is sre_constants.RANGE:
+            res.update(unichr(c) for c in range(iav[0], iav[1] + 1))
+          elif iop is sre_constants.CATEGORY and iav in categories:
+            res.update(categories[iav])
+          else:
+            return None
+        return res
+      if op is sre_constants.SUBPATTERN:
+        return TimestampSelector.getFirstChars(av[-1])
+      if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+        return TimestampSelector.getFirstChars(av[2])
+      if op is sre_constants.BRANCH:
+        res = set()
+        for item in av[1]:
+          chars = TimestampSelector.getFirstChars(item)
+          if chars is None:
+            return None
+          res.update(chars)
+        return res
+      return None
+
+    return None
+
+
+  @staticmethod
+  def getBranches(compiledRex):
+    """Returns the list of branches of the given compiled timestamp regexp as tuples (compiled
+       branch regexp, TimestampDecoder), or None if the branches are not all anchored at the
+       beginning of the text. A branch regexp only matches if the previous branches of the full
+       regexp starting with the same characters do not match (negative look-ahead), such that
+       its match result is the one of the full regexp."""
+
+    if compiledRex.pattern in TimestampSelector.branches:
+      return TimestampSelector.branches[compiledRex.pattern]
+
+    res = None
+    try:
+      if sre_parse.parse(compiledRex.pattern).pattern.flags != 0:
+        raise ValueError("Inline flags")
+
+      # Checks that all branches are anchored at the beginning of the text
+      texts = TimestampSelector.splitBranches(compiledRex.pattern)
+      parsed = [sre_parse.parse(t) for t in texts]
+      for p in parsed:
+        if len(p) == 0 or p[0][0] is not sre_constants.AT or \
+           p[0][1] not in (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING):
+          raise ValueError("Branch not anchored")
+
+      # Group names in the same order as in a groupdict result of the full regexp
+      names = dict.fromkeys(compiledRex.groupindex.keys()).keys()
+
+      res = list()
+      firstChars = [TimestampSelector.getFirstChars(p) for p in parsed]
+      for i, text in enumerate(texts):
+
+        # Previous branches which may match the same text
+        previous = list()
+        for j in range(i):
+          if firstChars[i] is None or firstChars[j] is None or firstChars[i] & firstChars[j]:
+            rex = CombinedPrefilter.getUncapturedRegexp(re.compile(texts[j], compiledRex.flags))
+            if rex is None:
+              raise ValueError("Branch cannot be used in look-ahead")
+            previous.append(rex)
+
+        if len(previous) > 0:
+          text = "(?!" + "|".join(previous) + ")" + text
+        rex = re.compile(text, compiledRex.flags)
+        res.append((rex, TimestampDecoder(rex, [k for k in names if k in rex.groupindex])))
+
+    except Exception:
+      res = None
+
+    TimestampSelector.branches[compiledRex.pattern] = res
+    return res
+
+
+  def __init__(self, eventType):
+    """Inits the selection for the timestamp regexp of the given EventType in a source file"""
+
+    self.eventType = eventType
+    self.branches = eventType.timestampBranches
+    self.selected = None
+    self.counts = [0] * len(self.branches) if self.branches else None
+
+
+  def search(self, line):
+    """Returns a tuple with the timestamp regexp search result in the given line and the
+       TimestampDecoder to use with it"""
+
+    # Searches the selected branch first
+    if self.selected is not None:
+      ts = self.selected[0].match(line)
+      if ts is not None:
+        return (ts, self.selected[1])
+
+    # Searches the full regexp, and counts the matching branch until the selection is done
+    ts = self.eventType.searchTimestamp(line)
+    if ts is not None and self.branches is not None and len(self.branches) > 1:
+      if self.selected is not None:
+        self.selected = None
+        self.counts = [0] * len(self.branches)
+      for i, (rex, decoder) in enumerate(self.branches):
+        if rex.match(line):
+          self.counts[i] += 1
+          break
+      if sum(self.counts) >= self.sniffedCount:
+        self.selected = self.branches[self.counts.index(max(self.counts))]
+
+    return (ts, self.eventType.timestampDecoder)
+
+
 class EventType:
   """Data to search text in logs for a particular set of files"""
 
@@ -1005,8 +2475,12 @@ class EventType:
     rexTextFlags = (re.IGNORECASE if not self.caseSensitive else 0)
     rexTextFlags |= (re.MULTILINE | re.DOTALL) if self.multilineCount > 1 else 0
     self.compiledRexText = getCompiledRegexp("RexText", self.rexText, rexTextFlags)
+    self.requiredLiterals = LiteralPrefilter.getRequiredLiterals(self.compiledRexText) \
+                            if self.multilineCount == 1 else None
     self.rexTimestamp = getValid(rexTimestamp, defaultRexTimestamp)
     self.compiledRexTimestamp = getCompiledRegexp("RexTimestamp", self.rexTimestamp)
+    self.timestampDecoder = TimestampDecoder(self.compiledRexTimestamp)
+    self.timestampBranches = TimestampSelector.getBranches(self.compiledRexTimestamp)
 
     # Helper function to compile and raise error
     def getCompiledCode(name, code):
@@ -1056,10 +2530,21 @@ class EventType:
 
 
   def searchTimestamp(self, text):
-    """Returns result of regexp search on timestamp"""
+    """Returns result of regexp search on timestamp, only at the beginning of the text if the
+       timestamp regexp is anchored"""
+    if self.timestampBranches is not None:
+      return self.compiledRexTimestamp.match(text)
     return self.compiledRexTimestamp.search(text)
 
 
+  def getTimestampData(self, ts, sourceTime=None):
+    """Returns a tuple with the timestamp as datetime, the span of the timestamp in text and the
+       list of additional fields (name, value) from the given timestamp regexp match result,
+       may raise exceptions if the timestamp cannot be computed. The year of sourceTime (or of
+       the current time) is used if the year is not part of the timestamp."""
+    return self.timestampDecoder.decode(ts, sourceTime)
+
+
   def initXML(self, xev):
     """Initializes event type from an XML element, see regulog.xsd"""
 
@@ -1215,6 +2700,227 @@ class EventTypeList(dict):
       print str(el)
 
 
+class GzipIndexedFile:
+  """Read-only file object on the decompressed data of a gzip file, with random access through
+     seek points: the starts of the gzip members (concatenated gzip streams, e.g. written by
+     bgzip), stored in the index directory once the file was read to the end, and snapshots of
+     the decompressor every snapshotInterval bytes, kept in memory only (the state of zlib
+     cannot be stored). Reading at an offset starts decompressing at the last seek point before
+     it, instead of the beginning of the file."""
+
+  # Number of compressed bytes read at once
+  blockSize = 256*1024
+
+  # Minimum number of decompressed bytes between two snapshots of the decompressor
+  snapshotInterval = 16*1024*1024
+
+  def __init__(self, path, indexDirectory=None):
+    """Opens the gzip file at the given path, with the seek points stored in indexDirectory
+       if given"""
+
+    self.name = path
+    self.mode = 'rb'
+    self.file = open(path, 'rb')
+
+    # Index file name, changed when the gzip file is modified
+    self.indexFile = None
+    if indexDirectory:
+      stat = os.fstat(self.file.fileno())
+      key = [os.path.abspath(path), str(stat.st_size), str(stat.st_mtime)]
+      self.indexFile = os.path.join(indexDirectory, hashlib.sha1('\n'.join(key)).hexdigest() +
+                                    ".gzi")
+
+    # Seek points (compressed offset, decompressed offset, decompressor snapshot or None at the
+    #  start of a member) ordered by decompressed offset
+    self.points = [(0, 0, None)]
+    if self.indexFile and os.path.isfile(self.indexFile):
+      with open(self.indexFile, 'rb') as f:
+        self.points = [(c, d, None) for (c, d) in cPickle.load(f)]
+    self.pointOffsets = [d for (c, d, z) in self.points]
+
+    self.position = 0                        # Position in decompressed data
+    self.restart(self.points[0])
+
+  def restart(self, point):
+    """Restarts decompressing at the given seek point"""
+
+    (compressedOffset, self.offset, snapshot) = point
+    self.file.seek(compressedOffset)
+    self.decompressor = snapshot.copy() if snapshot else zlib.decompressobj(16 + zlib.MAX_WBITS)
+    self.buffer = ''                         # Decompressed data from offset
+    self.ended = False
+
+  def addPoint(self, point):
+    """Inserts the given seek point, with a copy of the given decompressor if any, only kept
+       every snapshotInterval bytes"""
+
+    (compressedOffset, offset, decompressor) = point
+    i = bisect.bisect_right(self.pointOffsets, offset)
+    if self.pointOffsets[i-1] == offset or \
+       (decompressor is not None and offset - self.pointOffsets[i-1] < self.snapshotInterval):
+      return
+    if decompressor is not None:
+      point = (compressedOffset, offset, decompressor.copy())
+    self.points.insert(i, point)
+    self.pointOffsets.insert(i, point[1])
+
+  def decode(self):
+    """Decompresses the next block of the gzip file into the buffer"""
+
+    data = self.file.read(self.blockSize)
+    out = self.decompressor.decompress(data) if data else ''
+
+    # Starts a new decompressor at each following gzip member
+    while self.decompressor.unused_data:
+      rest = self.decompressor.unused_data
+      start = self.file.tell() - len(rest)
+      if len(rest) < 2:
+        rest += self.file.read(self.blockSize)
+      if not rest.startswith('\x1f\x8b'):     # Padding after the last member
+        data = ''
+        break
+      self.addPoint((start, self.offset + len(self.buffer) + len(out), None))
+      self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+      out += self.decompressor.decompress(rest)
+
+    self.buffer += out
+    if data:
+      self.addPoint((self.file.tell(), self.offset + len(self.buffer), self.decompressor))
+    else:
+      self.ended = True
+      self.saveIndex()
+
+  def saveIndex(self):
+    """Stores the starts of the gzip members in the index directory, once all are known"""
+
+    if self.indexFile and not os.path.isfile(self.indexFile):
+      indexDirectory = os.path.dirname(self.indexFile)
+      if not os.path.isdir(indexDirectory):
+        os.makedirs(indexDirectory)
+      tmpname = self.indexFile + "." + str(os.getpid())
+      with open(tmpname, 'wb') as f:
+        cPickle.dump([(c, d) for (c, d, z) in self.points if z is None], f,
+                     cPickle.HIGHEST_PROTOCOL)
+      os.rename(tmpname, self.indexFile)
+
+  def read(self, size=-1):
+    """Returns up to size bytes (all if negative) of decompressed data from the position"""
+
+    # Restarts at the last seek point before the position if the position is before the
+    #  buffer, or after the buffer and this seek point
+    i = bisect.bisect_right(self.pointOffsets, self.position) - 1
+    end = self.offset + len(self.buffer)
+    if self.position < self.offset or (self.position > end and self.pointOffsets[i] > end):
+      self.restart(self.points[i])
+
+    # Decompresses up to the end of the data, the data before the position is dropped
+    while (size < 0 or self.offset + len(self.buffer) < self.position + size) and not self.ended:
+      n = min(self.position - self.offset, len(self.buffer))
+      if n > 0:
+        self.buffer = self.buffer[n:]
+        self.offset += n
+      self.decode()
+
+    start = self.position - self.offset
+    data = self.buffer[start:] if size < 0 else self.buffer[start:start + size]
+    self.position += len(data)
+    return data
+
+  def seek(self, offset, whence=0):
+    """Sets the position in decompressed data, from the end is not supported (as GzipFile)"""
+
+    if whence == 1:
+      offset += self.position
+    elif whence != 0:
+      raise ValueError("Seek from end not supported")
+    self.position = offset
+
+  def tell(self):
+    return self.position
+
+  def close(self):
+    self.file.close()
+
+
+class ReopenedFile:
+  """File object on a plain file, used when many files are read at the same time (chronological
+     merge). At most maxOpen of these files are open, the least recently used one is closed
+     beyond, and opened again at the same offset on its next use."""
+
+  # Maximum number of open files
+  maxOpen = 256
+
+  # Open files in order of use, shared by all objects
+  openFiles = collections.OrderedDict()
+
+  def __init__(self, path):
+    self.path = path
+    self.file = None
+    self.offset = 0
+
+  def getFile(self):
+    """Returns the open file object, opened again if closed, marked as most recently used"""
+
+    if self.file is None:
+      while len(ReopenedFile.openFiles) >= ReopenedFile.maxOpen:
+        ReopenedFile.openFiles.popitem(last=False)[0].release()
+      self.file = open(self.path, 'rb')
+      self.file.seek(self.offset)
+    else:
+      del ReopenedFile.openFiles[self]
+    ReopenedFile.openFiles[self] = None
+
+    return self.file
+
+  def release(self):
+    """Closes the file, keeping its offset"""
+
+    self.offset = self.file.tell()
+    self.file.close()
+    self.file = None
+
+  def read(self, size=-1):
+    return self.getFile().read(size)
+
+  def seek(self, offset, whence=0):
+    self.getFile().seek(offset, whence)
+
+  def tell(self):
+    return self.getFile().tell()
+
+  def fileno(self):
+    return self.getFile().fileno()
+
+  def close(self):
+    if self.file is not None:
+      del ReopenedFile.openFiles[self]
+      self.file.close()
+      self.file = None
+
+
+def isDecompressedFile(fileobj):
+  """Returns true if the given file object decompresses its data without seek points (gzip or
+     bzip2, except GzipIndexedFile), i.e. seeking backward decompresses again from the start"""
+
+  return type(fileobj).__name__ in ['GzipFile', 'BZ2File', '_BZ2Proxy']
+
+
+def openTarFile(path, indexDirectory=None):
+  """Returns a TarFile object on the tar archive at the given path, through a GzipIndexedFile
+     if it is gzip-compressed"""
+
+  with open(path, 'rb') as f:
+    magic = f.read(2)
+  if magic == '\x1f\x8b':
+    fileobj = GzipIndexedFile(path, indexDirectory)
+    try:
+      return tarfile.open(fileobj=fileobj, mode='r:')
+    except tarfile.ReadError:
+      fileobj.close()
+
+  return tarfile.open(path, mode='r:*')
+
+
 class LogSource:
   """Source of log files from a directory (DIR), a tar archive (TAR), as zip archive (ZIP) or
      files directly given (LOG). An open tarfile/zipfile object is kept for archives."""
@@ -1232,23 +2938,61 @@ class LogSource:
       self.info = info
       self.fields = fields
       self.offset = 0                        # Modified during file re-ordering (log4j)
+      self.ranges = None                     # Byte ranges searched in parallel (DIR/LOG)
       self.destinationBasePath = None        # Used for path reduction (non-modifiable part)
       self.destinationRelativePath = None    # Used for path reduction (modifiable part)
+      self.original = None                   # First identical copy (see LogSet.deduplicate)
+      self.numCopies = 0                     # Number of later copies restored from this file
+      self.records = None                    # Event records restored for the later copies
+
+
+  # Size of blocks read from log files during search
+  readBlockSize = 4*1024*1024
+
+  # Size of blocks read from each log file during a chronological merge (many files open)
+  streamBlockSize = 64*1024
+
+  # Minimum size of byte ranges of a single log file searched in parallel (DIR/LOG only)
+  splitSize = 64*1024*1024
+
+  # Maximum number of bytes searched before the time window in plain log files
+  seekPrecision = 64*1024
+
+  # Number of lines at the beginning of a block read for a timestamp (end of time window)
+  blockTimeLines = 10
 
+  # Number of lines between two entries of the time index of a log file
+  indexInterval = 1000
+
+  # Number of bytes before the offset of a checkpoint compared to detect a replaced file
+  checkpointTailSize = 256
+
+  # Number of bytes at the beginning and at the end of log files compared to detect duplicates
+  fingerprintSize = 4096
 
   def __init__(self, verbosity, type, path=None, archive=None):
     """Inits the internal variables with the type of the source (DIR/TAR/ZIP/LOG), the base path
        equal to the archive file path (TAR/ZIP) or the directory of log files searched
-       by directory (DIR). A TarFile/ZipFile object must be provided for archives (TAR/ZIP)."""
+       by directory (DIR). A TarFile/ZipFile object must be provided for archives (TAR/ZIP),
+       or set later as a function opening it on first use, see getArchive."""
 
     self.verbosity = verbosity
     self.type = type                         # 'DIR', 'TAR"', 'ZIP', 'LOG'
     self.path = path                         # Pseudo path of archive/dir (empty for LOG)
     self.archive = archive                   # Archive object TarFile/ZipFile
+    self.openArchive = None                  # Function returning the archive object, or None
     self.logs = list()                       # List of LogSourceFile objects, in original order
     self.earliest = datetime.datetime.max
     self.latest   = datetime.datetime.min
 
+  def getArchive(self):
+    """Returns the archive object (TAR/ZIP), opened on first use if rebuilt from the scan cache
+       (see LogSet.openManifest)"""
+
+    if self.archive is None and self.openArchive is not None:
+      self.archive = self.openArchive()
+    return self.archive
+
   def getPseudoPath(self, logpath):
     """Returns the pseudo-path of the given logpath (taken from path in self.logs)"""
 
@@ -1263,10 +3007,10 @@ class LogSource:
       info = None
       tm = datetime.datetime.fromtimestamp(os.stat(logpath).st_mtime)
     elif self.type is 'TAR':
-      info = self.archive.getmember(logpath)
+      info = self.getArchive().getmember(logpath)
       tm = datetime.datetime.fromtimestamp(info.mtime)
     elif self.type is 'ZIP':
-      info = self.archive.getinfo(logpath)
+      info = self.getArchive().getinfo(logpath)
       i = info.date_time
       tm = datetime.datetime(i[0], i[1], i[2], i[3], i[4], i[5])
 
@@ -1442,8 +3186,8 @@ class LogSource:
     self.setDestinationPaths(outputdir, keepsourcedirs, globalsource)
     self.reduceDestinationPaths(joinlog4j, reducedirs)
 
-    # Extract source files to destination files
-    for l in self.logs:
+    # Extract source files to destination files, log4j joined files are written at their offset
+    for (l, sourcefile) in self.openLogFiles(self.logs):
       destFullPath = os.path.normpath(os.path.join(l.destinationBasePath, l.destinationRelativePath))
 
       # Checks if the destination directory exists, if not creates it
@@ -1465,12 +3209,8 @@ class LogSource:
       else:
         curtime = datetime.datetime.min
 
-      # Opens source and destination files
+      # Opens destination file (source file opened in sequence)
       destfile = open(destFullPath, 'r+b' if destexists else 'wb')
-      if self.type is 'LOG':   sourcefile = open(l.path, 'rb')
-      elif self.type is 'DIR': sourcefile = open(os.path.join(self.path, l.path), 'rb')
-      elif self.type is 'TAR': sourcefile = self.archive.extractfile(l.info)
-      else:                    sourcefile = self.archive.open(l.info)
 
       # Copy/extract
       if self.verbosity >= 2:
@@ -1498,8 +3238,687 @@ class LogSource:
       print "---", filenames
 
 
-  def search(self, searchContext, hideTimestamp):
-    """Goes through all log files of the source and searches events if filename matches"""
+  def readLines(self, sourcefile, blockSize=None):
+    """Generator returning lists of text lines (without CR/LF) read from the given file object
+       by blocks of blockSize bytes (default readBlockSize), where the lines straddling blocks
+       are re-assembled"""
+
+    rest = ''
+    while True:
+      block = sourcefile.read(blockSize or self.readBlockSize)
+      if len(block) == 0:
+        break
+
+      # Splits on LF only (as readline), last part is kept as beginning of next line
+      data = rest + block
+      lines = data.split('\n')
+      rest = lines.pop()
+      if '\r' in data:
+        lines = [l.rstrip('\r') for l in lines]
+      yield lines
+
+    # Last line without LF at end of file
+    if len(rest) > 0:
+      yield [rest.rstrip('\r')]
+
+
+  def isReopenable(self):
+    """Returns true if the log files of this source can be opened by another process, i.e. the
+       source is not an archive nested into another archive"""
+
+    return self.type in ['DIR', 'LOG'] or os.path.isfile(self.path)
+
+
+  def isConcurrent(self):
+    """Returns true if the log files of this source can be read at the same time, i.e. plain
+       files or members of a zip file (the members of tar files are read in sequence)"""
+
+    return self.type in ['DIR', 'LOG'] or (self.type is 'ZIP' and os.path.isfile(self.path))
+
+
+  def isCompressed(self):
+    """Returns true if this source is a tar archive read through a decompressor without seek
+       points (gzip/bzip2, except GzipIndexedFile), i.e. reaching a member decompresses the
+       archive again from its beginning"""
+
+    return self.type is 'TAR' and isDecompressedFile(self.getArchive().fileobj)
+
+
+  def getEventStreams(self, searchContext):
+    """Returns the list of event streams of the log files of this source matching at least one
+       event type, for the chronological merge (see EventSearchContext.mergeEvents). The search
+       of a log file starts when its stream is first read. The log files of sources that cannot
+       be read at the same time are searched completely at this point, as well as the members
+       of zip files beyond ReopenedFile.maxOpen members being read, their events being then
+       read back from disk (see spillEvents)."""
+
+    streams = list()
+    for logfile in self.logs:
+      if searchContext.checkSource(logfile.pseudoPath, logfile.time):
+        streams.append(self.streamEvents(searchContext, logfile))
+
+    return streams
+
+
+  def streamEvents(self, searchContext, logfile):
+    """Generator returning the events found in the given log file, searched with its own search
+       context (see EventSearchContext.getFileContext)"""
+
+    if self.verbosity >= 2: print "\nSearching events in", logfile.path
+
+    context = searchContext.getFileContext()
+    context.checkSource(logfile.pseudoPath, logfile.time)
+
+    # Plain files are closed between reads when too many are open (see ReopenedFile), each
+    #  member of a zip file being read keeps a file open
+    numOpenStreams = 0
+    if self.type in ['DIR', 'LOG']:
+      path = os.path.join(self.path, logfile.path) if self.type is 'DIR' else logfile.path
+      events = self.searchLogFile(context, logfile, self.streamBlockSize, ReopenedFile(path))
+    elif self.isConcurrent() and searchContext.numOpenStreams < ReopenedFile.maxOpen:
+      numOpenStreams = 1
+      events = self.searchLogFile(context, logfile, self.streamBlockSize)
+    else:
+      events = self.spillEvents(searchContext,
+                                self.searchLogFile(context, logfile, self.streamBlockSize))
+
+    searchContext.numOpenStreams += numOpenStreams
+    for ev in events:
+      yield ev
+    searchContext.numOpenStreams -= numOpenStreams
+
+    searchContext.numProcessedLines += context.numProcessedLines
+
+
+  def spillEvents(self, searchContext, events):
+    """Generator returning the given events once they are all written at the end of the
+       temporary run file of the search context (see Event.toSpillRecord), read back one by one
+       from the position of the next event, such that the events of the log files searched
+       completely by a chronological merge are not all kept in memory. One file is shared by
+       all log files, their events being written at once."""
+
+    if searchContext.runFile is None:
+      searchContext.runFile = tempfile.TemporaryFile()
+    run = searchContext.runFile
+    run.seek(0, 2)
+    pos = run.tell()
+    num = 0
+    for ev in events:
+      cPickle.dump(ev.toSpillRecord(), run, cPickle.HIGHEST_PROTOCOL)
+      num += 1
+
+    for i in xrange(num):
+      run.seek(pos)
+      record = cPickle.load(run)
+      pos = run.tell()
+      yield Event.fromSpillRecord(searchContext.eventTypes, record)
+
+
+  def getSearchTasks(self, searchContext, jobs):
+    """Returns the list of tasks for parallel search (see runSearchWorker) of the log files of
+       this source selected by the search context (see EventSearchContext.checkSource), empty if
+       the source is not re-openable. Large plain log files are split into several tasks, one
+       per byte range, unless a time window is given (lines before the window are skipped)."""
+
+    if not self.isReopenable():
+      return []
+
+    timeWindow = searchContext.timeFrom is not None or searchContext.timeTo is not None
+    tasks = list()
+    for l in self.logs:
+      if searchContext.selectsSource(l.pseudoPath, l.time) and \
+         not self.isRestored(searchContext, l):
+
+        # Splits large log files in up to one byte range per job
+        num = min(jobs, l.size // self.splitSize) \
+              if self.type in ['DIR', 'LOG'] and not timeWindow else 1
+        if num > 1:
+          l.ranges = self.getLineRanges(l, num)
+          for (start, end) in l.ranges:
+            tasks.append((self.type, self.path, l.path, l.pseudoPath, l.time, None, start, end))
+        else:
+          info = l.info if self.type is 'TAR' else None
+          tasks.append((self.type, self.path, l.path, l.pseudoPath, l.time, info, None, None))
+
+    return tasks
+
+
+  def isRestored(self, searchContext, logfile):
+    """Returns true if the given log file is a copy of another log file (see LogSet.deduplicate)
+       which events are restored from the events found in its original, i.e. if the original
+       is searched. Copies are searched themselves during incremental search."""
+
+    return logfile.original is not None and searchContext.checkpointFile is None and \
+           searchContext.selectsSource(logfile.original.pseudoPath, logfile.original.time)
+
+
+  def getFingerprint(self, logfile, full=False):
+    """Returns a fingerprint of the content of the given log file, compared to detect identical
+       copies of log files. By default, the fingerprint is cheap: first and last bytes of the
+       file (zip members are read up to the end, they cannot seek). If full, it is a hash of the
+       whole content."""
+
+    f = self.openLogFile(logfile)
+    try:
+      if full:
+        h = hashlib.sha1()
+        for block in iter(lambda: f.read(self.readBlockSize), ''):
+          h.update(block)
+        return h.digest()
+
+      head = f.read(self.fingerprintSize)
+      tail = ''
+      if logfile.size > 2 * self.fingerprintSize:
+        if self.type is 'ZIP':
+          for block in iter(lambda: f.read(self.readBlockSize), ''):
+            tail = (tail + block)[-self.fingerprintSize:]
+        else:
+          f.seek(logfile.size - self.fingerprintSize)
+          tail = f.read(self.fingerprintSize)
+      return head + tail
+    finally:
+      f.close()
+
+
+  def openLogFile(self, logfile):
+    """Returns an open file object on the given log file of this source"""
+
+    if self.type is 'ZIP':   return self.getArchive().open(logfile.info)
+    elif self.type is 'TAR': return self.getArchive().extractfile(logfile.info)
+    elif self.type is 'DIR': return open(os.path.join(self.path, logfile.path), 'rb')
+    else:                    return open(logfile.path, 'rb')
+
+
+  def openLogFiles(self, logs):
+    """Generator returning (log file, open file object) for each of the given log files of this
+       source, in the given order. If they are given in archive order, the members of a
+       compressed tar archive (see isCompressed) are read in one forward pass (tarfile stream
+       mode), such that the archive is decompressed once instead of seeking each member. A file
+       object is only valid until the next one is returned."""
+
+    # Opens a stream on the decompressed tar data, members of other sources are reached by seek
+    stream = None
+    if len(logs) > 0 and self.isCompressed():
+      offsets = [l.info.offset for l in logs]
+      if offsets == sorted(set(offsets)):
+        try:
+          self.getArchive().fileobj.seek(0)
+          stream = tarfile.open(fileobj=self.getArchive().fileobj, mode='r|')
+        except Exception as e:
+          if self.verbosity >= 2: print "TAR: stream error, members read separately:", e
+
+    if stream is None:
+      for l in logs:
+        yield (l, self.openLogFile(l))
+      return
+
+    # Reads the archive up to the last log file, stops at a log file not found in the stream
+    #  (not expected)
+    logfiles = collections.deque(logs)
+    for info in stream:
+      if info.offset > logfiles[0].info.offset:
+        break
+      if info.offset == logfiles[0].info.offset:
+        yield (logfiles.popleft(), stream.extractfile(info))
+        if len(logfiles) == 0:
+          break
+    stream.close()
+
+    # Reads separately the log files from the one not found, such that the order is kept
+    for l in logfiles:
+      yield (l, self.openLogFile(l))
+
+
+  def getLineRanges(self, logfile, num):
+    """Returns a list of up to num byte ranges (start, end) of the given plain log file, with
+       limits aligned on beginning of lines, the end of the last range being None (end of file)"""
+
+    limits = [0]
+    with self.openLogFile(logfile) as sourcefile:
+      for i in range(1, num):
+        sourcefile.seek(logfile.size * i // num)
+        sourcefile.readline()
+        if sourcefile.tell() > limits[-1] and sourcefile.tell() < logfile.size:
+          limits.append(sourcefile.tell())
+
+    return zip(limits, limits[1:] + [None])
+
+
+  def readRangeLines(self, sourcefile, start, end, incomplete=True):
+    """Generator returning the text lines (without CR/LF) of the byte range [start, end[ of the
+       given file object (end None for end of file), each one with the offset of its end. The
+       last line without LF is not returned if incomplete is false."""
+
+    sourcefile.seek(start)
+    pos = start
+    offset = start
+    rest = ''
+    while end is None or pos < end:
+      block = sourcefile.read(self.readBlockSize if end is None else
+                              min(self.readBlockSize, end - pos))
+      if len(block) == 0:
+        break
+      pos += len(block)
+
+      # Splits on LF only (as readline), last part is kept as beginning of next line
+      lines = (rest + block).split('\n')
+      rest = lines.pop()
+      for l in lines:
+        offset += len(l) + 1
+        yield (l.rstrip('\r'), offset)
+
+    # Last line without LF at end of range
+    if len(rest) > 0 and incomplete:
+      yield (rest.rstrip('\r'), offset + len(rest))
+
+
+  def findTimeOffset(self, searchContext, sourcefile, size):
+    """Returns the offset of a line of the given plain log file, assumed to be in chronological
+       order, such that all the lines before are earlier than the start of the time window. The
+       offset is found by dichotomy on the first timestamp after probed offsets, and is at most
+       seekPrecision bytes before the first line in the window (0 if not found, or if the
+       probed timestamps are not in chronological order)."""
+
+    lo = 0
+    hi = size
+    probes = list()
+    while hi - lo > self.seekPrecision:
+      mid = (lo + hi) // 2
+      sourcefile.seek(mid)
+      sourcefile.readline()
+
+      # Gets the first line with a timestamp after the probed offset (before hi)
+      start = sourcefile.tell()
+      tm = None
+      while tm is None and start < hi:
+        tm = searchContext.getLineTime(sourcefile.readline().rstrip('\r\n'))
+        if tm is None:
+          start = sourcefile.tell()
+
+      # Lines without timestamp are kept in the searched part
+      if tm is not None:
+        probes.append((start, tm))
+      if tm is not None and tm < searchContext.timeFrom:
+        lo = start
+      else:
+        hi = mid
+
+    probes.sort()
+    for i in range(1, len(probes)):
+      if probes[i][1] < probes[i-1][1]:
+        return 0
+
+    return lo
+
+
+  def countLines(self, searchContext, logfile, sourcefile, end):
+    """Returns the number of lines in the first end bytes of the given plain log file. The
+       lines are counted from the nearest seek point before end, i.e. an offset with the number
+       of lines before it, a seek point being added after each block read. The seek points of
+       a file are kept in the index directory of the search context if given (see
+       getIndexFilename), so that the lines before a time window are read at most once."""
+
+    filename = None
+    points = [(0, 0)]
+    if searchContext.indexDirectory:
+      filename = self.getIndexFilename(searchContext, logfile, sourcefile, ["lines"])
+      if os.path.isfile(filename):
+        with open(filename, 'rb') as f:
+          points = cPickle.load(f)
+
+    (pos, count) = points[bisect.bisect_right(points, (end, sys.maxint)) - 1]
+    numPoints = len(points)
+    sourcefile.seek(pos)
+    while pos < end:
+      block = sourcefile.read(min(self.readBlockSize, end - pos))
+      if len(block) == 0:
+        break
+      pos += len(block)
+      count += block.count('\n')
+      bisect.insort(points, (pos, count))
+
+    if filename and len(points) > numPoints:
+      self.storeIndex(filename, points)
+
+    return count
+
+
+  def getIndexFilename(self, searchContext, logfile, sourcefile, keys):
+    """Returns the path of an index file of the given log file in the index directory of the
+       search context, named after the pseudo-path, the size and the modification time of the
+       log file and the given list of strings"""
+
+    size = logfile.info.size if self.type is 'TAR' else os.fstat(sourcefile.fileno()).st_size
+    key = [logfile.pseudoPath, str(size), logfile.time.isoformat()] + keys
+    return os.path.join(searchContext.indexDirectory,
+                        hashlib.sha1('\n'.join(key)).hexdigest() + ".idx")
+
+
+  def storeIndex(self, filename, data):
+    """Stores the given data into an index file, renamed once written (index directory shared
+       by parallel searches)"""
+
+    directory = os.path.dirname(filename)
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    tmpname = filename + "." + str(os.getpid())
+    with open(tmpname, 'wb') as f:
+      cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmpname, filename)
+
+
+  def getTimeIndex(self, searchContext, logfile, sourcefile):
+    """Returns the time index of the given log file, i.e. the list of (offset, line number,
+       timestamp) of every indexInterval lines with the first timestamp found from this line.
+       The index is read from the index directory of the search context, otherwise built by
+       reading the whole file and stored. Index files are named after the log file and the
+       timestamp regexps of the search, see getIndexFilename."""
+
+    # Index file name, changed when the log file or the timestamp regexps change
+    filename = self.getIndexFilename(
+      searchContext, logfile, sourcefile,
+      sorted(set(evt.rexTimestamp for evt in searchContext.searchEventTypes)))
+
+    if os.path.isfile(filename):
+      with open(filename, 'rb') as f:
+        return cPickle.load(f)
+
+    # Builds index, the entry of a line waits for the next timestamp
+    index = list()
+    entry = None
+    linenum = 0
+    offset = 0
+    for (line, end) in self.readRangeLines(sourcefile, 0, None):
+      if linenum % self.indexInterval == 0:
+        entry = (offset, linenum)
+      if entry is not None:
+        tm = searchContext.getLineTime(line)
+        if tm is not None:
+          index.append(entry + (tm,))
+          entry = None
+      linenum += 1
+      offset = end
+
+    self.storeIndex(filename, index)
+    return index
+
+
+  def findIndexedTimeOffset(self, searchContext, index):
+    """Returns the offset and number of the line of the last entry of the given time index
+       earlier than the start of the time window, (0, 0) if there is none or if the entries
+       are not in chronological order"""
+
+    for i in range(1, len(index)):
+      if index[i][2] < index[i-1][2]:
+        return (0, 0)
+
+    i = bisect.bisect_left([tm for (offset, linenum, tm) in index], searchContext.timeFrom)
+    return index[i-1][:2] if i > 0 else (0, 0)
+
+
+  def getBlockTime(self, searchContext, lines):
+    """Returns the first timestamp found in the first lines of the given block of lines, None if
+       not found"""
+
+    for line in itertools.islice(lines, 0, self.blockTimeLines):
+      tm = searchContext.getLineTime(line)
+      if tm is not None:
+        return tm
+
+    return None
+
+
+  def searchLogFileRange(self, searchContext, logfile, start, end):
+    """Searches events in a byte range of a plain log file in a worker process, starting with
+       an empty search state. Events found before the state of the search is known to be the
+       same as for a search from the beginning of the file are discarded, i.e. before the first
+       line (first sync line) where no event waits for a timestamp and the multiline buffer is
+       full, as well as events found after the last such line (last sync line). Returns a tuple
+       with the number of lines in range, the first sync line, the last sync line, the offsets
+       of the lines in multiline buffer at last sync line, and the found event records."""
+
+    maxlen = searchContext.lines.maxlen
+    offsets = collections.deque(maxlen=maxlen)     # Start offsets of lines in multiline buffer
+    records = list()
+    numRecords = 0
+    firstSync = 0 if start == 0 else None          # No discarded events at beginning of file
+    lastSync = (None, None, None)
+    linenum = 0
+    lineStart = start
+
+    with self.openLogFile(logfile) as sourcefile:
+      for (line, lineEnd) in self.readRangeLines(sourcefile, start, end):
+        linenum += 1
+        offsets.append(lineStart)
+        lineStart = lineEnd
+
+        for ev in searchContext.checkLine(line):
+          records.append(ev.toRecord())
+
+        # Checks if this is a sync line
+        if len(searchContext.unfinishedEvents) == 0 and (start == 0 or linenum >= maxlen):
+          if firstSync is None:
+            firstSync = linenum
+            records = list()
+          lastSync = (linenum, offsets[0], lineEnd)
+          numRecords = len(records)
+
+    return (linenum, firstSync) + lastSync + (records[:numRecords],)
+
+
+  def searchLogFileRanges(self, searchContext, logfile, results):
+    """Searches events in the given plain log file from the results of the parallel search of
+       its byte ranges (see searchLogFileRange), returns the found events as checkLine. The
+       lines between the last sync line of a range and the first sync line of the next range
+       are searched again in this process, from the multiline buffer of the last sync line."""
+
+    sourcefile = self.openLogFile(logfile)
+    pos = 0                                       # Offset of next line to search
+    base = 0                                      # Number of lines before current range
+
+    for (start, end) in logfile.ranges:
+      (numLines, firstSync, lastSync, bufferStart, lastSyncEnd, records) = next(results)
+
+      if firstSync is not None:
+
+        # Searches the lines before the first sync line of the range
+        if searchContext.linenum < base + firstSync:
+          for (line, pos) in self.readRangeLines(sourcefile, pos, None):
+            for ev in searchContext.checkLine(line):
+              yield ev
+            if searchContext.linenum == base + firstSync:
+              break
+
+        # Takes the events of the range from the worker if the search state is the same
+        if searchContext.linenum == base + firstSync and len(searchContext.unfinishedEvents) == 0:
+          for ev in searchContext.restoreEvents(lastSync - firstSync, records, base):
+            yield ev
+
+          # Continues after last sync line of range, with the same multiline buffer
+          lines = [line for (line, lineEnd) in
+                   self.readRangeLines(sourcefile, bufferStart, lastSyncEnd)]
+          searchContext.resetLines(lines, base + lastSync)
+          pos = lastSyncEnd
+
+      base += numLines
+
+      if self.verbosity >= 2 or searchContext.chronological:
+        searchContext.printAdvancement(logfile.pseudoPath)
+
+    # Searches the remaining lines and finishes current multiline treatment
+    for (line, pos) in self.readRangeLines(sourcefile, pos, None):
+      for ev in searchContext.checkLine(line):
+        yield ev
+    for ev in searchContext.checkLine(None):
+      yield ev
+
+    sourcefile.close()
+
+
+  def searchLogFile(self, searchContext, logfile, blockSize=None, sourcefile=None):
+    """Searches events in the given log file of the source, returns the found events as
+       checkLine. The search context must have been prepared with checkSource. With a time
+       window, the lines before the window are skipped by dichotomy in plain files (skipped
+       lines only counted, see countLines), and using the time index of the file in tar members
+       if an index directory is given. The reading stops at the first block of lines after the
+       window if the blocks read so far are in chronological order, once the events started in
+       the window are finished. The log file is opened unless an open file object is given
+       (read forward only without time window, except for plain files)."""
+
+    # Incremental search, from the checkpoint of the previous search
+    if searchContext.checkpointFile:
+      for ev in self.searchLogFileIncrement(searchContext, logfile, sourcefile):
+        yield ev
+      return
+
+    # Open file
+    if sourcefile is None:
+      sourcefile = self.openLogFile(logfile)
+
+    # Skips the lines before the time window
+    if searchContext.timeFrom is not None:
+      if self.type in ['DIR', 'LOG']:
+        start = self.findTimeOffset(searchContext, sourcefile,
+                                    os.fstat(sourcefile.fileno()).st_size)
+        searchContext.linenum = self.countLines(searchContext, logfile, sourcefile, start)
+        sourcefile.seek(start)
+      elif searchContext.indexDirectory and self.type is 'TAR':
+        index = self.getTimeIndex(searchContext, logfile, sourcefile)
+        (start, searchContext.linenum) = self.findIndexedTimeOffset(searchContext, index)
+        sourcefile.seek(start)
+
+    # Reads batches of text lines from log file and searches for events, then finishes
+    #  current multiline treatment (last line set to None)
+    lastTime = datetime.datetime.min              # None once blocks are not in order
+    for lines in itertools.chain(self.readLines(sourcefile, blockSize), [[None]]):
+
+      # Stops at the first block after the time window if blocks are in chronological order,
+      #  after the lines of the block still needed by the events started in the window, i.e.
+      #  the lines until their next timestamp and the following lines of multiline patterns
+      if searchContext.timeTo is not None and lastTime is not None and lines != [None]:
+        tm = self.getBlockTime(searchContext, lines)
+        if tm is not None:
+          lastTime = tm if tm >= lastTime else None
+          if lastTime is not None and tm > searchContext.timeTo:
+            numLines = max(evt.multilineCount for evt in searchContext.searchEventTypes) - 1
+            for (i, line) in enumerate(lines):
+              if i >= numLines and len(searchContext.unfinishedEvents) == 0:
+                break
+              for ev in searchContext.checkLine(line):
+                yield ev
+            lines = [None]
+
+      for ev in searchContext.checkLines(lines):
+        yield ev
+
+      if self.verbosity >= 2 or searchContext.chronological:
+        searchContext.printAdvancement(logfile.pseudoPath)
+
+      if lines == [None]:
+        break
+
+    # Closes file
+    sourcefile.close()
+
+
+  def searchLogFileIncrement(self, searchContext, logfile, sourcefile=None):
+    """Searches events in the data appended to the given log file since the previous search,
+       i.e. from its checkpoint, then stores its new checkpoint. Plain files are resumed at the
+       offset of the checkpoint with the line number, the multiline buffer and the unfinished
+       events of the previous search, unless they were truncated or replaced (inode, size and
+       bytes before the offset are checked). A file renamed since (rotation) is resumed from the
+       checkpoint of its inode. The events still unfinished at the end of a file are completed
+       by the next search, at once for a renamed file or a file not appended since the previous
+       search, and before searching again a truncated or replaced file. Archive members are
+       searched again if modified only. Returns the found events as checkLine. The log file is
+       opened unless an open file object is given (archive member read forward only)."""
+
+    previous = searchContext.previousCheckpoints
+    checkpoint = previous.get(logfile.pseudoPath)
+    if sourcefile is None:
+      sourcefile = self.openLogFile(logfile)
+
+    # Archive members are not appended
+    if self.type not in ['DIR', 'LOG']:
+      if checkpoint is None or checkpoint.get('size') != logfile.size or \
+         checkpoint.get('time') != logfile.time:
+        for lines in itertools.chain(self.readLines(sourcefile), [[None]]):
+          for ev in searchContext.checkLines(lines):
+            yield ev
+          if self.verbosity >= 2 or searchContext.chronological:
+            searchContext.printAdvancement(logfile.pseudoPath)
+      searchContext.checkpoints[logfile.pseudoPath] = dict(size=logfile.size, time=logfile.time)
+      sourcefile.close()
+      return
+
+    # Gets the checkpoint of the file inode, renamed if under another path
+    stat = os.fstat(sourcefile.fileno())
+    fileId = (stat.st_dev, stat.st_ino)
+    renamed = False
+    if checkpoint is None or checkpoint.get('id') != fileId:
+      checkpoint = None
+      for (path, cp) in previous.items():
+        if cp.get('id') == fileId:
+          (checkpoint, renamed) = (cp, True)
+          break
+
+    # Resumes the search if the file still has the same bytes before the offset, otherwise
+    #  completes the events left unfinished by the previous search before searching again
+    start = 0
+    if checkpoint is not None:
+      searchContext.resumeState(checkpoint['state'])
+      if stat.st_size >= checkpoint['offset']:
+        tail = checkpoint['tail']
+        sourcefile.seek(checkpoint['offset'] - len(tail))
+        if sourcefile.read(len(tail)) == tail:
+          start = checkpoint['offset']
+      if start == 0:
+        if self.verbosity >= 1:
+          print "\nLog file truncated or replaced, searched again:", logfile.pseudoPath
+        for ev in searchContext.checkLine(None):
+          yield ev
+        searchContext.resetLines([], 0)
+
+    # Searches the complete lines after the offset
+    offset = start
+    for (line, offset) in self.readRangeLines(sourcefile, start, None, incomplete=False):
+      for ev in searchContext.checkLine(line):
+        yield ev
+      if self.verbosity >= 2 or searchContext.chronological:
+        searchContext.printAdvancement(logfile.pseudoPath)
+
+    # A renamed file is not appended anymore, and the events of a file not appended since the
+    #  previous search are completed as by a search without checkpoints
+    if renamed or (start > 0 and stat.st_size == checkpoint.get('size')):
+      for ev in searchContext.checkLine(None):
+        yield ev
+
+    # Stores the checkpoint with the bytes before the offset
+    sourcefile.seek(max(0, offset - self.checkpointTailSize))
+    tail = sourcefile.read(offset - sourcefile.tell())
+    searchContext.checkpoints[logfile.pseudoPath] = dict(id=fileId, offset=offset, tail=tail,
+                                                         size=stat.st_size,
+                                                         state=searchContext.getResumeState())
+    sourcefile.close()
+
+
+  def search(self, searchContext, hideTimestamp, results=None):
+    """Goes through all log files of the source and searches events if filename matches. If
+       given, results is an iterator on the results of the parallel search tasks, in the order
+       of the tasks returned by getSearchTasks. The selected members of compressed tar archives
+       are read in one forward pass (see openLogFiles), unless searched with a time window. The
+       events of the copies of log files (see LogSet.deduplicate) are restored from their
+       original."""
+
+    # Opens the selected log files searched directly, in sequence (the archive is not opened
+    #  if no file is selected)
+    files = None
+    if self.type is 'TAR' and searchContext.timeFrom is None and \
+       (results is None or not self.isReopenable()):
+      logs = [l for l in self.logs if searchContext.selectsSource(l.pseudoPath, l.time) and
+                                      not self.isRestored(searchContext, l)]
+      if len(logs) > 0 and self.isCompressed():
+        files = self.openLogFiles(logs)
 
     for logfile in self.logs:
 
@@ -1509,36 +3928,72 @@ class LogSource:
       # Checks if path matches
       if searchContext.checkSource(logfile.pseudoPath, logfile.time):
 
-        # Open file
-        if self.type is 'ZIP':   sourcefile = self.archive.open(logfile.info)
-        elif self.type is 'TAR': sourcefile = self.archive.extractfile(logfile.info)
-        elif self.type is 'DIR': sourcefile = open(os.path.join(self.path, logfile.path), 'rb')
-        else:                    sourcefile = open(logfile.path, 'rb')
-
-        # Reads text lines from log file and searches for events
-        done = False
-        while not done:
-          line = sourcefile.readline()
-          if line == '':
-            done = True
-            line = None
-          else:
-            line = line.rstrip("\n\r")
+        # Gets events restored from the original of a copy, from parallel search if available,
+        # otherwise searches file directly
+        if self.isRestored(searchContext, logfile):
+          original = logfile.original
+          records = [(r[0], logfile.pseudoPath) + r[2:] for r in original.records]
+          original.numCopies -= 1
+          if original.numCopies == 0:
+            original.records = None
+          events = searchContext.restoreEvents(0, records)
+        elif results is not None and self.isReopenable() and logfile.ranges:
+          events = self.searchLogFileRanges(searchContext, logfile, results)
+        elif results is not None and self.isReopenable():
+          (numLines, records) = next(results)
+          events = searchContext.restoreEvents(numLines, records)
+        elif files is not None:
+          (l, sourcefile) = next(files)
+          if l is not logfile:
+            raise RuntimeError("Log file " + l.pseudoPath + " opened instead of " +
+                               logfile.pseudoPath)
+          events = self.searchLogFile(searchContext, logfile, sourcefile=sourcefile)
+        else:
+          events = self.searchLogFile(searchContext, logfile)
 
-          # Prints events if any found
-          for ev in searchContext.checkLine(line):
-            if self.verbosity >= 1 and not searchContext.chronological:
-              ev.display(hideTimestamp)
+        # Keeps the records of the events of an original with copies, see Event.toRecord
+        transferEvents = searchContext.transferEvents
+        if logfile.numCopies > 0 and searchContext.checkpointFile is None:
+          logfile.records = list()
+          searchContext.transferEvents = True
 
-          if self.verbosity >= 2 or searchContext.chronological:
-            searchContext.printAdvancement(logfile.pseudoPath)
+        # Prints events if any found
+        for ev in events:
+          if logfile.records is not None:
+            logfile.records.append(ev.toRecord())
+            ev.setMatchedTexts(None, None)
+          if self.verbosity >= 1 and not searchContext.chronological:
+            ev.display(hideTimestamp)
+        searchContext.transferEvents = transferEvents
 
-        # Closes file
-        sourcefile.close()
+        if self.verbosity >= 2 or searchContext.chronological:
+          searchContext.printAdvancement(logfile.pseudoPath)
 
 
 class LogSet:
 
+  # Maximum total size of the nested archives kept in memory during a command, see
+  #  spoolArchiveMember
+  spoolSize = 64*1024*1024
+
+  # Maximum number of events stored by follow if no retention is given, such that the memory
+  #  stays bounded while following
+  followRetention = 100000
+
+  class FollowedFile:
+    """Helper class to store variables of a log file followed by LogSet.follow"""
+
+    def __init__(self, path, context, sourcefile, fileId):
+      """Constructor with path (full path), context (search context of the file, see
+         EventSearchContext.getFileContext), open file object and (device, inode) of the file"""
+      self.path = path
+      self.context = context
+      self.sourcefile = sourcefile
+      self.fileId = fileId
+      self.rest = ''                         # Last line read, not terminated by LF yet
+      self.lastDataTime = time.time()        # Time when data was last read from the file
+
+
   def __init__(self, verbosity, eventTypes, pathFilter = ".*\\.log*"):
     """Inits object with verbosity (value 0 to 2), a LogEventList object, a pathfilter given
        as a regexp to search"""
@@ -1551,6 +4006,15 @@ class LogSet:
     # List of log sources found during scan
     self.sources = list()
 
+    # Manifests of scanned archive files per absolute path (see scanPaths), or None
+    self.scanCache = None
+
+    # Directory of the seek points of gzip-compressed tar archives (see scanPaths), or None
+    self.indexDirectory = None
+
+    # Total size of the nested archives spooled in memory (see spoolArchiveMember)
+    self.spooledSize = 0
+
   def checkPathFilter(self, path):
     """Checks if the path matches the path filter after normalizing it to "/" separator,
        returns None if not otherwise returns the acquired named groups"""
@@ -1559,10 +4023,12 @@ class LogSet:
     return res.groupdict() if bool(res) else None
 
 
-  def scanPath(self, path, archivePathRex, file=None):
+  def scanPath(self, path, archivePathRex, file=None, manifest=None, parent=None, member=None):
     """Opens recursively a file or directory for processing, using given path or file handle.
        During the scan, first each file name will be matched to the path filter,
-       then otherwise matched to the archive path regexp"""
+       then otherwise matched to the archive path regexp. If a manifest list is given, the
+       opened archives are recorded into it (see openManifest), parent being the index in the
+       manifest of the archive containing the file handle and member its name/info there."""
 
     # Number of items found in this run
     res = 0
@@ -1604,17 +4070,22 @@ class LogSet:
 
     # Case 3 TAR/ZIP: given path points on archive file, or given handler on archive file in archive
     elif file or (not file and os.path.isfile(path) and archivePathRex.search(path)):
+
+      # Archive files are looked up first in the scan cache if any
+      if not file and manifest is None and self.scanCache is not None:
+        return self.scanCachedArchive(path, archivePathRex)
+
       tar = None
       zip = None
 
       # First tries to open the given file as tar
       if self.verbosity>=2:
-        print "\nTrying to open as archive", path if not file else file.name
+        print "\nTrying to open as archive", path
       try:
         if file:
           tar = tarfile.open(fileobj=file, mode='r:*')
         else:
-          tar = tarfile.open(path, mode='r:*')
+          tar = openTarFile(path, self.indexDirectory)
         if self.verbosity>=2: print "TAR: successfully open"
       except Exception as et:
         if self.verbosity>=2: print "TAR: tarfile.open error:", et
@@ -1631,6 +4102,14 @@ class LogSet:
       # Either tar or zip was open, get archive file names to check them
       source = LogSource(self.verbosity, "TAR" if tar else "ZIP", path, tar if tar else zip)
 
+      # Records the archive in the manifest, with the log files once scanned
+      if manifest is not None:
+        entry = dict(type=source.type, path=path, parent=parent, member=member, logs=None)
+        manifest.append(entry)
+        index = len(manifest) - 1
+      else:
+        index = None
+
       addedNames = set()
       for f in tar if tar else zip.namelist():
         name = f if zip else f.name
@@ -1645,21 +4124,130 @@ class LogSet:
 
         # Recurses into archive if extension matches
         elif fields is None and archivePathRex.search(fullpath):
-          newFile = tar.extractfile(f) if tar else zip.open(f)
-          res += self.scanPath(os.path.join(path, name), archivePathRex, newFile)
+          newFile = self.spoolArchiveMember(tar if tar else zip, f)
+          res += self.scanPath(os.path.join(path, name), archivePathRex, newFile, manifest,
+                               index, f)
 
       if source.count() > 0:
         self.sources.append(source)
+        if manifest is not None:
+          entry['order'] = len([e for e in manifest if e['logs'] is not None])
+          entry['logs'] = [(l.path, l.pseudoPath, l.time, l.size, l.info, l.fields)
+                           for l in source.logs]
       return res
 
 
-  def scanPaths(self, paths, extarchive):
+  def spoolArchiveMember(self, archive, member):
+    """Returns a seekable file object on the given member (info or name) of the given
+       TarFile/ZipFile object, on which a nested archive is opened. The member of a tar archive
+       is read in place, unless the tar archive is decompressed without seek points. Otherwise
+       (zip members cannot seek), the member is copied into a temporary file, kept in memory
+       while the total size of the spooled members stays below spoolSize, on disk beyond, such
+       that the parent is decompressed once for the nested archive (e.g. tar file in a zip)."""
+
+    if isinstance(archive, tarfile.TarFile):
+      memberfile = archive.extractfile(member)
+      if not isDecompressedFile(archive.fileobj):
+        return memberfile
+    else:
+      memberfile = archive.open(member)
+
+    # Spools in memory up to the remaining size, on disk once exceeded (0 would be unlimited)
+    remaining = self.spoolSize - self.spooledSize
+    spool = tempfile.SpooledTemporaryFile(remaining) if remaining > 0 \
+            else tempfile.TemporaryFile()
+    shutil.copyfileobj(memberfile, spool, 1024*1024)
+    memberfile.close()
+    if spool.tell() <= remaining:
+      self.spooledSize += spool.tell()
+    spool.seek(0)
+
+    return spool
+
+
+  def scanCachedArchive(self, path, archivePathRex):
+    """Calls scanPath for the given archive file, unless it is found in the scan cache with the
+       same size, modification time, path filter and archive extensions. The sources of the
+       archive are then created from the cached manifest, without reading the archive (see
+       openManifest)."""
+
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    signature = (path, stat.st_size, stat.st_mtime, self.rexPathFilter.pattern,
+                 archivePathRex.pattern)
+
+    cached = self.scanCache.get(key)
+    if cached is not None and cached[0] == signature:
+      if self.verbosity >= 2: print "\nArchive found in scan cache", path
+      return self.openManifest(cached[1])
+
+    manifest = list()
+    res = self.scanPath(path, archivePathRex, manifest=manifest)
+    self.scanCache[key] = (signature, manifest)
+    self.scanCacheModified = True
+    return res
+
+
+  def openManifest(self, manifest):
+    """Adds the log files of the archives recorded in the given manifest (see scanPath) as new
+       sources in the order of the scan. Returns the number of log files. The archives are
+       opened on first use only, nested archives from their member in the parent archive."""
+
+    # Archive objects per index in the manifest, opened by openArchive
+    archives = dict()
+
+    def openArchive(index):
+      if index not in archives:
+        entry = manifest[index]
+        if entry['parent'] is None:
+          file = None
+        else:
+          file = self.spoolArchiveMember(openArchive(entry['parent']), entry['member'])
+
+        if entry['type'] == 'TAR':
+          archives[index] = tarfile.open(fileobj=file, mode='r:*') if file \
+                            else openTarFile(entry['path'], self.indexDirectory)
+        else:
+          archives[index] = zipfile.ZipFile(file if file else entry['path'])
+      return archives[index]
+
+    sources = list()
+    for (index, entry) in enumerate(manifest):
+
+      # Creates the source with the log files found during the scan, type is mapped back to
+      # literals as compared by identity
+      if entry['logs'] is not None:
+        type = [t for t in ['TAR', 'ZIP'] if t == entry['type']][0]
+        source = LogSource(self.verbosity, type, entry['path'])
+        source.openArchive = lambda index=index: openArchive(index)
+        source.logs = [LogSource.LogSourceFile(*l) for l in entry['logs']]
+        source.earliest = min(l.time for l in source.logs)
+        source.latest = max(l.time for l in source.logs)
+        sources.append((entry['order'], source))
+
+    self.sources.extend(source for (order, source) in sorted(sources))
+    return sum(source.count() for (order, source) in sources)
+
+
+  def scanPaths(self, paths, extarchive, scanCacheFile=None, indexDirectory=None):
     """Calls scanPath for a semi-colon separated list of filenames/dirnames, with semi-colon
-       separated list of archive extensions"""
+       separated list of archive extensions. If a scan cache file is given, the archive files
+       already scanned are not read again, see scanCachedArchive. The seek points of the
+       gzip-compressed tar archives are kept in indexDirectory if given, see GzipIndexedFile."""
+
+    self.indexDirectory = indexDirectory
 
     # List of log files given directly to scan, to be filled by scanPath
     self.singleLogFiles = LogSource(self.verbosity, 'LOG', "")
 
+    # Reads the manifests of the archive files from the scan cache file
+    self.scanCacheModified = False
+    if scanCacheFile:
+      self.scanCache = dict()
+      if os.path.isfile(scanCacheFile):
+        with open(scanCacheFile, 'rb') as f:
+          self.scanCache = cPickle.load(f)
+
     # Calls scanPath for all items in list
     print "\n--------------- BEGIN PATH SCAN -", time.strftime("%H:%M:%S"), "---------------"
     for p in paths.split(";"):
@@ -1668,6 +4256,15 @@ class LogSet:
       # Builds regexp for archive extensions and calls sub-function
       self.scanPath(p, re.compile("(?i)(" + extarchive.replace(";", "|") + ")$"))
 
+    # Stores the manifests of the archive files scanned this time
+    if self.scanCacheModified:
+      tmpname = scanCacheFile + "." + str(os.getpid())
+      with open(tmpname, 'wb') as f:
+        cPickle.dump(self.scanCache, f, cPickle.HIGHEST_PROTOCOL)
+      if os.path.exists(scanCacheFile):
+        os.remove(scanCacheFile)
+      os.rename(tmpname, scanCacheFile)
+
     print "\n---------------- END PATH SCAN -", time.strftime("%H:%M:%S"), "----------------"
 
     # Adds log files given directly to list of sources
@@ -1681,6 +4278,59 @@ class LogSet:
       print s
 
 
+  def deduplicate(self, mode):
+    """Detects the log files found several times with the same content (e.g. in a directory and
+       in a backup archive of it), compared by size, then by fingerprint of the first and last
+       bytes, then by hash of the whole content. The first copy in the order of the sources is
+       the original. In mode 'first', the other copies are removed from their sources, such that
+       they are neither searched nor extracted. In mode 'all', they are kept and their events are
+       restored from the events found in the original during the search (the events are
+       attributed to each path), see LogSource.search. In 'all' mode, only the copies searched for
+       the same event types are compared, as the event types depend on the path."""
+
+    # Groups the log files by key, only groups of more than one file are kept
+    def refine(groups, key):
+      refined = list()
+      for group in groups:
+        keys = dict()
+        for (i, s, l) in group:
+          keys.setdefault(key(s, l), list()).append((i, s, l))
+        refined.extend(g for g in keys.values() if len(g) > 1)
+      return refined
+
+    files = [(s, l) for s in self.sources for l in s.logs]
+    groups = [[(i, s, l) for (i, (s, l)) in enumerate(files)]]
+    if mode == 'all':
+      groups = refine(groups, lambda s, l: (l.size, frozenset(evt.name for evt in
+                      self.eventTypes.values() if evt.searchFilename(l.pseudoPath))))
+    else:
+      groups = refine(groups, lambda s, l: l.size)
+    groups = refine(groups, lambda s, l: s.getFingerprint(l))
+    groups = refine(groups, lambda s, l: s.getFingerprint(l, full=True))
+
+    # Marks or removes the copies
+    print "\nDuplicate log files:"
+    numCopies = 0
+    for group in sorted(groups, key=lambda g: g[0][0]):
+      original = group[0][2]
+      for (i, s, l) in group[1:]:
+        print "--", l.pseudoPath, "==", original.pseudoPath
+        if mode == 'all':
+          l.original = original
+          original.numCopies += 1
+        else:
+          s.logs.remove(l)
+        numCopies += 1
+    print numCopies, "copies of", len(groups), "log file(s)"
+
+    # Removes the sources without log files left
+    if mode != 'all':
+      self.sources = [s for s in self.sources if s.count() > 0]
+      for s in self.sources:
+        s.earliest = min(l.time for l in s.logs)
+        s.latest = max(l.time for l in s.logs)
+
+
   def extract(self, outputdir, keepsourcedirs=False, joinlog4j=False, reducedirs=False,
               globalsource=False):
     """Extract log files from archives to the outputdir"""
@@ -1693,15 +4343,63 @@ class LogSet:
     print "\n---------------- END EXTRACTION -", time.strftime("%H:%M:%S"), "----------------"
 
 
-  def search(self, chronological, hideTimestamp, globalsource, outputdir):
-    """Search events in log files"""
+  def search(self, chronological, hideTimestamp, globalsource, outputdir, searchEngine='regex',
+             jobs=1, streamWindow=0, spillSize=0, database=None, timeFrom=None, timeTo=None,
+             indexDirectory=None, checkpointFile=None, retention=0):
+    """Search events in log files, using jobs worker processes if more than 1. If chronological
+       and streamWindow is greater than 0, the events of all log files are merged in
+       chronological order during the search (no parallel search), and only the latest
+       retention events are kept in memory (streamWindow events if 0). Otherwise, the stored
+       events beyond spillSize events are spilled to disk if spillSize is greater than 0. The
+       events are written into the given SQLite database file if any. If given, only the events
+       between timeFrom and timeTo are searched, see LogSource.searchLogFile, using the time
+       indexes of log files kept in indexDirectory if given. If a checkpoint file is given, only
+       the data appended since the previous search is searched (no parallel search)."""
 
     print "\n--------------- BEGIN SEARCH -", time.strftime("%H:%M:%S"), "---------------"
 
-    context = EventSearchContext(self.verbosity, self.eventTypes, chronological, outputdir)
+    context = EventSearchContext(self.verbosity, self.eventTypes, chronological, outputdir,
+                                 searchEngine, streamWindow=streamWindow, spillSize=spillSize,
+                                 database=database, timeFrom=timeFrom, timeTo=timeTo,
+                                 indexDirectory=indexDirectory, checkpointFile=checkpointFile,
+                                 retention=retention)
+
+    # Skips the sources where all log files were last modified before the time window
+    sources = [s for s in self.sources if context.checkFileTime(s.latest)]
+    if self.verbosity >= 2 and len(sources) < len(self.sources):
+      print "\nSkipping", len(self.sources) - len(sources), "source(s) before time window"
+
+    # Searches all log files at the same time and merges their events chronologically
+    if context.streamWindow > 0:
+      if jobs > 1:
+        print "WARNING: jobs option ignored, no parallel search with a stream window"
+      streams = list()
+      for s in sources:
+        streams.extend(s.getEventStreams(context))
+      for ev in context.mergeEvents(streams):
+        if self.verbosity >= 1:
+          ev.display(hideTimestamp)
 
-    for s in self.sources:
-      s.search(context, hideTimestamp)
+    else:
+      # Starts parallel search of log files in worker processes, results are then consumed in
+      #  the order of the sources, such that the events are stored as during a serial search
+      pool = None
+      results = None
+      if jobs > 1 and not checkpointFile:
+        tasks = list()
+        for s in sources:
+          tasks.extend(s.getSearchTasks(context, jobs))
+        xml = [ET.tostring(evt.toXML()) for evt in self.eventTypes.values()]
+        pool = multiprocessing.Pool(jobs, initSearchWorker, (self.verbosity, xml, searchEngine,
+                                                             timeFrom, timeTo, indexDirectory))
+        results = pool.imap(runSearchWorker, tasks)
+
+      try:
+        for s in sources:
+          s.search(context, hideTimestamp, results)
+      finally:
+        if pool:
+          pool.terminate()
 
     for ev in context.wrapup(outputdir):
       if chronological and self.verbosity >= 1:
@@ -1710,6 +4408,251 @@ class LogSet:
     print "\n---------------- END SEARCH -", time.strftime("%H:%M:%S"), "----------------"
 
 
+  def getFollowedPaths(self, paths):
+    """Returns the list of the plain log files matching the path filter in the given semi-colon
+       separated list of filenames/dirnames (archives are not followed)"""
+
+    res = list()
+    for p in paths.split(";"):
+      if os.path.isdir(p):
+        for dirpath, dirnames, filenames in os.walk(p):
+          for filename in filenames:
+            fullpath = os.path.join(dirpath, filename)
+            if self.checkPathFilter(fullpath) is not None:
+              res.append(fullpath)
+      elif os.path.isfile(p) and self.checkPathFilter(p) is not None:
+        res.append(p)
+
+    return res
+
+
+  def openFollowedFile(self, context, path, fromEnd, fileIds, foundIds):
+    """Opens the given log file for LogSet.follow, returns a FollowedFile object or None if no
+       event type matches the file, it cannot be opened or it was already followed under another
+       path, i.e. its (device, inode) is mapped to another path in the given dict fileIds (rotated
+       file). The file is read from the beginning of its last line if fromEnd, otherwise from its
+       beginning. The (device, inode) of the opened file is then mapped to its path in fileIds.
+       The (device, inode) of the file is added to the set foundIds if it can be opened."""
+
+    try:
+      sourcefile = open(path, 'rb')
+    except IOError:
+      return None
+    stat = os.fstat(sourcefile.fileno())
+    fileId = (stat.st_dev, stat.st_ino)
+    foundIds.add(fileId)
+    if fileIds.get(fileId, path) != path:
+      sourcefile.close()
+      return None
+    pseudoPath = path.replace("\\", "/")
+    fileTime = datetime.datetime.fromtimestamp(stat.st_mtime).replace(microsecond=0)
+
+    # Executes the execonfile code, then prepares the search context of the file
+    fileContext = context.getFileContext()
+    if not context.checkSource(pseudoPath, fileTime) or \
+       not fileContext.checkSource(pseudoPath, fileTime):
+      sourcefile.close()
+      return None
+
+    # Skips the existing lines, only counted
+    if fromEnd:
+      start = 0
+      for block in iter(lambda: sourcefile.read(LogSource.readBlockSize), ''):
+        fileContext.linenum += block.count('\n')
+        if '\n' in block:
+          start = sourcefile.tell() - len(block) + block.rindex('\n') + 1
+      sourcefile.seek(start)
+
+    if self.verbosity >= 1:
+      print "\nFollowing", pseudoPath
+    fileIds[fileId] = path
+    return self.FollowedFile(path, fileContext, sourcefile, fileId)
+
+
+  def readFollowedFile(self, followed, flushTimeout):
+    """Generator returning the events found in the data appended to the given FollowedFile
+       object since the previous call, as checkLine. The file is finished (last line and
+       unfinished events) once it is removed, renamed or truncated, and its object then closed.
+       Unfinished events are completed once no data was appended for flushTimeout seconds."""
+
+    def readLines():
+      while True:
+        block = followed.sourcefile.read(LogSource.streamBlockSize)
+        if len(block) == 0:
+          break
+        followed.lastDataTime = time.time()
+
+        # Splits on LF only, the last part is kept until its LF is written
+        lines = (followed.rest + block).split('\n')
+        followed.rest = lines.pop()
+        for ev in followed.context.checkLines([l.rstrip('\r') for l in lines]):
+          yield ev
+
+    for ev in readLines():
+      yield ev
+
+    # Checks if the file is still the one at its path
+    try:
+      stat = os.stat(followed.path)
+    except OSError:
+      stat = None
+    if stat is None or (stat.st_dev, stat.st_ino) != followed.fileId or \
+       stat.st_size < followed.sourcefile.tell():
+
+      # Reads the data appended before the file was renamed, then finishes the file
+      for ev in readLines():
+        yield ev
+      for ev in self.finishFollowedFile(followed):
+        yield ev
+
+    # Completes the unfinished events if the file was not appended since the timeout
+    elif len(followed.context.unfinishedEvents) > 0 and \
+         time.time() - followed.lastDataTime >= flushTimeout:
+      for ev in followed.context.checkLine(None):
+        yield ev
+
+
+  def finishFollowedFile(self, followed):
+    """Generator returning the events completed by the last line (not terminated by LF) and the
+       end of the given FollowedFile object, as checkLine, then closes the file"""
+
+    lines = [followed.rest.rstrip('\r'), None] if len(followed.rest) > 0 else [None]
+    for ev in followed.context.checkLines(lines):
+      yield ev
+    followed.sourcefile.close()
+
+
+  def follow(self, paths, hideTimestamp, outputdir, searchEngine='regex', pollInterval=1.0,
+             flushTimeout=5.0, retention=0):
+    """Searches events continuously in the plain log files matching the path filter in the
+       given semi-colon separated list of filenames/dirnames, until interrupted (Ctrl-C), then
+       executes the wrapup code and saves the events in outputdir if given. The log files found
+       at start are followed from their end, the log files found later from their beginning.
+       Files and directories are polled every pollInterval seconds while no data is appended.
+       Log files renamed or truncated are searched again from the beginning of the new file at
+       their path, renamed files are not searched again under their new path (rotated files).
+       Unfinished events are completed after flushTimeout seconds without data appended to their
+       file. The oldest events are deleted beyond retention stored events (followRetention if
+       not given or 0), they are then written into the export files in outputdir as they are
+       deleted, so that the memory stays bounded."""
+
+    print "\n--------------- BEGIN FOLLOW -", time.strftime("%H:%M:%S"), "---------------"
+
+    context = EventSearchContext(self.verbosity, self.eventTypes, False, outputdir,
+                                 searchEngine, retention=retention or self.followRetention)
+    context.events.startExport(outputdir, None)
+
+    # FollowedFile objects per path, and path per (device, inode) of the files followed while
+    # found at their path or another path, so that rotated files (e.g. app.log.1 renamed to
+    # app.log.2) are not searched again
+    followed = dict()
+    fileIds = dict()
+    fromEnd = True
+
+    try:
+      while True:
+
+        # Opens the log files found since the previous poll, files not opened are tried again
+        # at next poll (e.g. created empty, or unreadable yet)
+        foundIds = set()
+        for path in self.getFollowedPaths(paths):
+          if path in followed:
+            foundIds.add(followed[path].fileId)
+          else:
+            f = self.openFollowedFile(context, path, fromEnd, fileIds, foundIds)
+            if f is not None:
+              followed[path] = f
+        fromEnd = False
+
+        # Forgets the files no longer found (e.g. rotated files deleted), their inode can be
+        #  reused by a new file
+        for fileId in fileIds.keys():
+          if fileId not in foundIds:
+            del fileIds[fileId]
+
+        # Searches the appended data, files renamed or truncated are opened again at next poll
+        appended = False
+        for (path, f) in sorted(followed.items()):
+          lastDataTime = f.lastDataTime
+          for ev in self.readFollowedFile(f, flushTimeout):
+            context.recordEvent(ev)
+            if self.verbosity >= 1:
+              ev.display(hideTimestamp)
+          appended = appended or f.lastDataTime != lastDataTime
+          if f.sourcefile.closed:
+            del followed[path]
+
+        if not appended:
+          time.sleep(pollInterval)
+
+    except KeyboardInterrupt:
+      print "\nFollow interrupted"
+
+    # Finishes the followed files
+    for f in followed.values():
+      for ev in self.finishFollowedFile(f):
+        context.recordEvent(ev)
+        if self.verbosity >= 1:
+          ev.display(hideTimestamp)
+
+    context.wrapup(outputdir)
+
+    print "\n---------------- END FOLLOW -", time.strftime("%H:%M:%S"), "----------------"
+
+
+# State of a worker process for parallel search, set by initSearchWorker
+searchWorker = dict()
+
+def initSearchWorker(verbosity, xmlEventTypes, searchEngine, timeFrom=None, timeTo=None,
+                     indexDirectory=None):
+  """Initializes a worker process for parallel search, event types are given as XML strings"""
+
+  eventTypes = EventTypeList(verbosity)
+  for x in xmlEventTypes:
+    evt = EventType()
+    evt.initXML(ET.fromstring(x))
+    eventTypes.addEventType(evt)
+
+  searchWorker['verbosity'] = verbosity
+  searchWorker['context'] = EventSearchContext(verbosity, eventTypes, False, None, searchEngine,
+                                               workerMode=True, timeFrom=timeFrom, timeTo=timeTo,
+                                               indexDirectory=indexDirectory)
+  searchWorker['sources'] = dict()
+
+
+def runSearchWorker(task):
+  """Searches events in one log file in a worker process, where task is given by
+     LogSource.getSearchTasks. Returns the number of processed lines and the list of records
+     of found events."""
+
+  (type, path, logpath, pseudoPath, tm, info, start, end) = task
+  context = searchWorker['context']
+  sources = searchWorker['sources']
+
+  # Opens source once per worker, type is mapped back to literals as compared by identity
+  type = [t for t in ['DIR', 'TAR', 'ZIP', 'LOG'] if t == type][0]
+  if (type, path) not in sources:
+    if type is 'TAR':   archive = openTarFile(path, context.indexDirectory)
+    elif type is 'ZIP': archive = zipfile.ZipFile(path)
+    else:               archive = None
+    sources[(type, path)] = LogSource(searchWorker['verbosity'], type, path, archive)
+  source = sources[(type, path)]
+
+  # Gets archive member info (given for TAR, as getmember reads all members), searches file
+  if type is 'ZIP': info = source.archive.getinfo(logpath)
+  logfile = LogSource.LogSourceFile(logpath, pseudoPath, tm, None, info)
+
+  # Searches the whole file or only the given byte range
+  context.checkSource(pseudoPath, tm)
+  if start is not None:
+    return source.searchLogFileRange(context, logfile, start, end)
+
+  numLines = context.numProcessedLines
+  records = [ev.toRecord() for ev in source.searchLogFile(context, logfile)]
+
+  return (context.numProcessedLines - numLines, records)
+
+
 def getDefaultEventType(params):
 
   # Gets values entered by user if at least the text pattern is given
@@ -1757,6 +4700,23 @@ def splitLogPaths(params):
     return params["inlogpaths"].split(';')
 
 
+def parseTimeOption(value):
+  """Returns the datetime given as 'YYYY-MM-DD[ HH:MM[:SS[.ffffff]]]' (or with 'T' as separator)
+     in a time window option, None if empty, raises ValueError if the format is not valid"""
+
+  if not value:
+    return None
+
+  value = value.strip().replace('T', ' ')
+  for fmt in ["%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]:
+    try:
+      return datetime.datetime.strptime(value, fmt)
+    except ValueError:
+      pass
+
+  raise ValueError("Invalid time '" + value + "', expected format is YYYY-MM-DD HH:MM:SS")
+
+
 def overview(si):
 
   params = si.getValues()
@@ -1764,7 +4724,9 @@ def overview(si):
   # Opens logs
   for paths in splitLogPaths(params):
     logs = LogSet(int(params["verbosity"]), readEventsDefinition(params), params["pathfilter"])
-    logs.scanPaths(paths, params["extarchive"])
+    logs.scanPaths(paths, params["extarchive"], params["scancache"], params["indexdir"])
+    if params["dedup"] != 'none':
+      logs.deduplicate(params["dedup"])
 
 
 def extract(si):
@@ -1774,7 +4736,9 @@ def extract(si):
   # Opens logs
   for paths in splitLogPaths(params):
     logs = LogSet(int(params["verbosity"]), readEventsDefinition(params), params["pathfilter"])
-    logs.scanPaths(paths, params["extarchive"])
+    logs.scanPaths(paths, params["extarchive"], params["scancache"], params["indexdir"])
+    if params["dedup"] != 'none':
+      logs.deduplicate('first')
 
     logs.extract(params["outputdir"], params["keepsourcedirs"], params["joinlog4j"],
                  params["reducedirs"], params["globalsource"])
@@ -1786,13 +4750,43 @@ def search(si):
   # Gets event types including possibly the default event
   eventTypes = readEventsDefinition(params)
 
+  # Gets time window
+  try:
+    timeFrom = parseTimeOption(params["from"])
+    timeTo = parseTimeOption(params["to"])
+  except ValueError as e:
+    print "ERROR:", e
+    return
+
   # Opens logs
   if len(eventTypes) > 0:
     for paths in splitLogPaths(params):
       logs = LogSet(int(params["verbosity"]), eventTypes, params["pathfilter"])
-      logs.scanPaths(paths, params["extarchive"])
+      logs.scanPaths(paths, params["extarchive"], params["scancache"], params["indexdir"])
+      if params["dedup"] != 'none':
+        logs.deduplicate(params["dedup"])
       logs.search(params["chronological"], params["hidetimestamp"], params["globalsource"],
-                  params["outputdir"])
+                  params["outputdir"], params["searchengine"], int(params["jobs"]),
+                  int(params["streamwindow"]), int(params["spillsize"]), params["database"],
+                  timeFrom, timeTo, params["indexdir"], params["checkpoints"],
+                  int(params["retention"]))
+  else:
+    print "ERROR: no event type definition"
+
+
+def follow(si):
+
+  params = si.getValues()
+
+  # Gets event types including possibly the default event
+  eventTypes = readEventsDefinition(params)
+
+  # Follows all paths together
+  if len(eventTypes) > 0:
+    logs = LogSet(int(params["verbosity"]), eventTypes, params["pathfilter"])
+    logs.follow(params["inlogpaths"], params["hidetimestamp"], params["outputdir"],
+                params["searchengine"], float(params["pollinterval"]),
+                float(params["flushtimeout"]), int(params["retention"]))
   else:
     print "ERROR: no event type definition"
 
@@ -1863,9 +4857,38 @@ def main(argv):
   if 'aib' in __version__: val += ";.pmf"
   si.addOption("Archive extensions", desc, "S", "e", "extarchive", val, format='W160')
 
+  desc = "File where the overview/extract/search commands keep the list of log files found in " +\
+         "each archive file, such that archives not modified since are not read again\n"        +\
+         "The list is renewed when the size or modification time of the archive, the path "     +\
+         "filter or the archive extensions change. Directories are always scanned, as the "      +\
+         "size of their log files is needed."
+  si.addOption("Scan cache file", desc, 'OF', "h", "scancache", format='')
+
+  desc = "Directory where the overview/extract/search commands keep indexes of log files, "     +\
+         "renewed when the files are modified\n"                                                +\
+         "The starts of the gzip members of gzip-compressed tar archives read to the end are "  +\
+         "kept, such that the decompression of an archive made of several gzip members (e.g. "  +\
+         "written by bgzip) starts at the member of the data to read. The search command also " +\
+         "keeps a time index of each tar archive member read with a time window, giving the "   +\
+         "position, line number and timestamp of every 1000 lines: it is built on the first "   +\
+         "search of a member, then used to go straight to the start of the time window in "     +\
+         "later searches. The lines skipped before the time window in plain log files are "     +\
+         "counted once, then the line counts are kept for later searches."
+  si.addOption("Index directory", desc, 'OD', "l", "indexdir", format='L')
+
+  desc = "Detection of log files found several times with the same content (e.g. in a "          +\
+         "directory and in a backup archive of it), compared by size, first and last bytes, "    +\
+         "then by hash of the whole content. The copies are extracted and searched only once.\n" +\
+         "With 'first', the events are attributed to the first copy only. With 'all', the "       +\
+         "events found in the first copy are attributed to each copy as if each copy was "       +\
+         "searched (except with a stream window or checkpoints, where copies are searched)."
+  type = "E;none:None:No detection;first:First:Events of first copy only;" +\
+         "all:All:Events of each copy"
+  si.addOption("Duplicate log files", desc, type, "U", "dedup", "none", format='')
+
   desc = "Displays overview of input log files, based on filenamess/dirs structure (not content)"
   si.addCommand("Logs overview", desc, "overview", lambda: overview(si), ["inlogpaths"],
-                ["pathfilter"])
+                ["pathfilter", "scancache", "indexdir", "dedup"])
 
 
   # Output directory
@@ -1888,7 +4911,8 @@ def main(argv):
   si.addOption("Reduce directories", desc, 'B', "r", "reducedirs", format='')
 
   si.addCommand("Extract", "Extract/copy all files from given archives/dirs into output directory",
-                "extract", lambda: extract(si), ["inlogpaths", "outputdir"], ["pathfilter"])
+                "extract", lambda: extract(si), ["inlogpaths", "outputdir"],
+                ["pathfilter", "scancache", "indexdir", "dedup"])
 
 
   # Events input file
@@ -1909,9 +4933,111 @@ def main(argv):
          "ordered at the end of the search"
   si.addOption("Chronological", desc, 'B', "c", "chronological", format='')
 
+  desc = "Engine used by the search command to match the text regexps of the event types on "  +\
+         "each line of the log files\n"                                                        +\
+         "With 'regex', each text regexp is searched separately, except for event types which " +\
+         "required literal strings are not found in the line. With 'combined', the text "       +\
+         "regexps are combined into one single regexp searched once per line, and only the "    +\
+         "event types that matched are searched again separately to extract fields (faster "    +\
+         "with many event types on short lines). Multiline event types, or regexps with "       +\
+         "back-references or inline flags, are always searched separately."
+  type = "E;regex:Regex:One regexp per event type;combined:Combined:One regexp for all types"
+  si.addOption("Search engine", desc, type, "s", "searchengine", "regex", format='')
+
+  desc = "Number of worker processes used by the search command to search log files in "      +\
+         "parallel (default 1 for no parallel search)\n"                                         +\
+         "Events are found in parallel, then stored, executed and displayed in the same order " +\
+         "as a search with one single process. Log files of archives nested into other "        +\
+         "archives are not searched in parallel. Large log files (not in archives) are split " +\
+         "into byte ranges searched in parallel."
+  si.addOption("Jobs", desc, 'S', "n", "jobs", "1", format='W30')
+
+  desc = "If greater than 0 for a chronological search, the log files are searched at the "   +\
+         "same time and their events are merged in chronological order during the search, "    +\
+         "instead of being sorted at the end (default 0 for no merge)\n"                      +\
+         "The value gives the number of events of a log file kept to re-order events with "    +\
+         "out-of-order timestamps. Events are executed, displayed and stored as soon as they " +\
+         "are merged. Only the latest events are kept in memory (see retention option, stream "  +\
+         "window by default), older events are written into the XML/CSV files and database as " +\
+         "they are removed, such that the Python code only finds the latest earlier events. "  +\
+         "The execonfile code of all log files is executed at the beginning of the search. "   +\
+         "Log files of tar files or nested archives are searched completely when their first " +\
+         "event is needed. No parallel search is done (jobs option ignored)."
+  si.addOption("Stream window", desc, 'S', "w", "streamwindow", "0", format='W30')
+
+  desc = "Maximum number of events stored by the follow command or by a search with a stream " +\
+         "window (default 0 for 100000 events with follow, the stream window with a search)\n"  +\
+         "Beyond this number, the oldest events are removed as with delete_event, such that "   +\
+         "the memory stays bounded. The Python code then only finds the latest events. The "    +\
+         "removed events are still written into the XML/CSV files (and database with a stream " +\
+         "window)."
+  si.addOption("Retention", desc, 'S', "y", "retention", "0", format='W30')
+
+  desc = "Maximum number of events kept in memory by the search command (default 0 for no "  +\
+         "limit)\n"                                                                            +\
+         "Beyond this number, the oldest events are moved into a temporary database on disk, " +\
+         "and read back when they are needed by Python code, display strings or exports. "     +\
+         "During a chronological search, they are merged with the events in memory in "        +\
+         "chronological order at the end of the search. Not used with a retention or a "       +\
+         "stream window, which already limit the number of events in memory."
+  si.addOption("Spill size", desc, 'S', "m", "spillsize", "0", format='W30')
+
+  desc = "SQLite database file where the found events are written by the search command before " +\
+         "the execution of wrapup Python code (an existing file is replaced)\n"                  +\
+         "The 'events' table contains one row per event (seqnum, name, timestamp, path, line, " +\
+         "raw), the 'fields' table one row per user field (seqnum, name, value). The database " +\
+         "is kept up to date by wrapup Python code, see query_events, and can be queried after " +\
+         "the search."
+  si.addOption("Database file", desc, 'OF', "d", "database", format='')
+
+  desc = "Start of the time window of the search command, as 'YYYY-MM-DD HH:MM:SS' (seconds "  +\
+         "and time optional)\n"                                                                 +\
+         "Only the events with a timestamp in the time window are stored. Log files last "      +\
+         "modified before the start are not read, and the beginning of plain log files is "     +\
+         "skipped up to the start (log files are assumed to be in chronological order)."
+  si.addOption("From", desc, 'S', "a", "from", format='W160')
+
+  desc = "End of the time window of the search command, same format as the from option\n"      +\
+         "The reading of a log file stops once the lines are after the end, if the lines read " +\
+         "so far are in chronological order (after the lines of the last events in the time "  +\
+         "window)."
+  si.addOption("To", desc, 'S', "u", "to", format='W160')
+
+  desc = "File where the search command keeps a checkpoint of each log file, such that the "    +\
+         "next search only reads the data appended since (incremental search)\n"                +\
+         "Log files truncated or replaced are searched again from the beginning, rotated files " +\
+         "are found by inode. The last event of a file is completed once the next line is "     +\
+         "written, or by the next search if the file is not appended in between, rotated, "      +\
+         "truncated or replaced. Archive members are searched again only if modified. "         +\
+         "All log files are searched again if the event types change. No parallel search is "    +\
+         "done (jobs option ignored)."
+  si.addOption("Checkpoint file", desc, 'OF', "q", "checkpoints", format='')
+
   si.addCommand("Search Events", "Search for events in the input files",
                 "search", lambda: search(si), ["inlogpaths"],
-                ["pathfilter", "outputdir", "ineventtypes"])
+                ["pathfilter", "outputdir", "ineventtypes", "searchengine", "jobs",
+                 "streamwindow", "retention", "spillsize", "database", "from", "to", "indexdir",
+                 "checkpoints", "scancache", "dedup"])
+
+  # Follow events
+
+  desc = "Number of seconds the follow command waits before polling again the log files and " +\
+         "directories when no data was appended (default 1)"
+  si.addOption("Poll interval", desc, 'S', "b", "pollinterval", "1", format='W30')
+
+  desc = "Number of seconds after which the follow command completes the events still waiting " +\
+         "for the next line with a timestamp (multiline events), when no data is appended to "  +\
+         "their log file (default 5)"
+  si.addOption("Flush timeout", desc, 'S', "z", "flushtimeout", "5", format='W30')
+
+  desc = "Searches events continuously in the data appended to the log files (no archives) "   +\
+         "until interrupted with Ctrl-C, then executes the wrapup code and saves the events\n"  +\
+         "Log files found at start are followed from their end, new log files matching the "    +\
+         "path filter from their beginning. Renamed or truncated log files are followed again " +\
+         "from the beginning of the new file at their path."
+  si.addCommand("Follow Events", desc, "follow", lambda: follow(si), ["inlogpaths"],
+                ["pathfilter", "outputdir", "ineventtypes", "searchengine", "pollinterval",
+                 "flushtimeout", "retention"])
 
 # FIXME: modify bfScriptInterface to take all parameters into account whater the position of
 #        the command on the HMI
@@ -2051,7 +5177,14 @@ def main(argv):
 
   desc = "Python code executed on wrapup (end of the search), same pre-defined variables and "   +\
          "functions can be used as in execonstart and execonmatch (except current 'event' local "+\
-         "variable)"
+         "variable). If a database file is given, the following variables and functions are "   +\
+         "available as well:\n"                                                                  +\
+         " - query_events(condition, params, limit): returns an iterator on the events "         +\
+         "selected by an SQL condition on the 'events' table in sequence number order, e.g. "    +\
+         "query_events(\"name = ? AND seqnum IN (SELECT seqnum FROM fields WHERE name = 'code' " +\
+         "AND value = ?)\", ('ERR', '5')), limit being the maximum number of events (default " +\
+         "0 for no limit)\n"                                                                     +\
+         " - database: the sqlite3 connection to the database, e.g. for aggregate queries"
   si.addOption("Exec On Wrapup", desc, 'T', "W", "execonwrapup", format='')
 
   desc = "Name of the Default Event Type given directly through the GUI or the command-line\n"+\